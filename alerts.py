@@ -0,0 +1,269 @@
+# Rule-based alerts on book metrics and spoof events.
+#
+# Rules come from ALERT_RULES, separated by ';', for example
+#   "imbalance_10 > 30 for 2s; spread_bps > 8; largest_bid >= 100; spoof"
+# optionally prefixed with a symbol ("NSE:SBIN-EQ imbalance_10 < -40"), or from
+# a JSON list in ALERT_RULES_FILE. Threshold rules are kept sorted per metric
+# and operator, so a book update costs a few bisects per metric that has rules
+# and only the rules whose threshold lies between the old and new value are
+# touched - however many rules are configured.
+import os
+import re
+import json
+import time
+import queue
+import bisect
+import threading
+
+import requests
+
+ALERT_RULES = os.getenv('ALERT_RULES', '').strip("'")
+ALERT_RULES_FILE = os.getenv('ALERT_RULES_FILE', '').strip("'")
+ALERT_WEBHOOK_URL = os.getenv('ALERT_WEBHOOK_URL', '').strip("'")
+ALERT_COOLDOWN = float(os.getenv('ALERT_COOLDOWN', '30'))  # seconds between repeats of one rule per symbol
+LOT_SIZE = int(os.getenv('LOT_SIZE', '50'))
+
+# Metrics read from the market_depth payload; largest_* are in lots
+METRICS = ('imbalance_10', 'imbalance_20', 'imbalance_50', 'spread_bps', 'largest_bid', 'largest_ask')
+EVENTS = ('spoof',)
+
+_RULE_PATTERN = re.compile(
+    r'^(?:(?P<symbol>\S+:\S+)\s+)?(?P<metric>\w+)'
+    r'(?:\s*(?P<op>>=|<=|>|<)\s*(?P<value>-?\d+(?:\.\d+)?))?'
+    r'(?:\s+for\s+(?P<hold>\d+(?:\.\d+)?)\s*s)?$'
+)
+
+def parse_rule(text):
+    """Parse one rule string into a rule dict; raises ValueError if it is not understood"""
+    match = _RULE_PATTERN.match(text.strip())
+    if not match:
+        raise ValueError(f"Cannot parse alert rule: {text!r}")
+    rule = {
+        'name': text.strip(),
+        'symbol': match.group('symbol'),
+        'metric': match.group('metric'),
+        'op': match.group('op'),
+        'value': float(match.group('value')) if match.group('value') else None,
+        'for': float(match.group('hold') or 0),
+    }
+    return validate_rule(rule)
+
+def validate_rule(rule):
+    rule.setdefault('symbol', None)
+    rule.setdefault('op', None)
+    rule.setdefault('value', None)
+    rule.setdefault('for', 0)
+    rule.setdefault('cooldown', ALERT_COOLDOWN)
+    if rule['metric'] in METRICS:
+        if rule['op'] not in ('>', '>=', '<', '<=') or rule['value'] is None:
+            raise ValueError(f"Alert rule on {rule['metric']} needs a comparison, e.g. '{rule['metric']} > 10'")
+    elif rule['metric'] not in EVENTS:
+        raise ValueError(f"Unknown alert metric {rule['metric']!r}; expected one of {METRICS + EVENTS}")
+    rule.setdefault('name', f"{rule['metric']} {rule['op'] or ''} {rule['value'] if rule['value'] is not None else ''}".strip())
+    return rule
+
+def load_rules(text=ALERT_RULES, path=ALERT_RULES_FILE):
+    """Rules from the ';'-separated string and/or the JSON file; bad rules are reported and skipped"""
+    rules = []
+    for part in text.split(';'):
+        if part.strip():
+            try:
+                rules.append(parse_rule(part))
+            except ValueError as e:
+                print(f"[ALERT] {e}")
+    if path:
+        try:
+            with open(path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[ALERT] Could not read {path}: {e}")
+            entries = []
+        for entry in entries:
+            try:
+                rules.append(parse_rule(entry) if isinstance(entry, str) else validate_rule(dict(entry)))
+            except (KeyError, ValueError) as e:
+                print(f"[ALERT] Skipping rule {entry!r}: {e}")
+    return rules
+
+def metric_value(payload, metric):
+    """Current value of a metric in a market_depth payload, or None if undefined"""
+    if metric == 'spread_bps':
+        return payload['spread_bps'] if payload.get('asks') and payload.get('bids') else None
+    if metric in ('largest_bid', 'largest_ask'):
+        level = payload.get(metric)
+        return level['qty'] / LOT_SIZE if level else None
+    return payload[metric]['imbalance_pct']
+
+def _crossed(op, thresholds, old, new):
+    """Index ranges (activated, deactivated) of sorted thresholds whose rule flipped from old to new"""
+    count = len(thresholds)
+    if op in ('>', '>='):
+        # Rule holds for a prefix of the ascending thresholds
+        find = bisect.bisect_left if op == '>' else bisect.bisect_right
+        before = 0 if old is None else find(thresholds, old)
+        after = find(thresholds, new)
+        return (range(before, after), range(0)) if after >= before else (range(0), range(after, before))
+    # '<' / '<=' hold for a suffix
+    find = bisect.bisect_right if op == '<' else bisect.bisect_left
+    before = count if old is None else find(thresholds, old)
+    after = find(thresholds, new)
+    return (range(after, before), range(0)) if after <= before else (range(0), range(before, after))
+
+class AlertEngine:
+    """Edge-triggered evaluation of alert rules with hold times and per-rule cooldowns"""
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.sinks = []
+        # metric -> op -> (sorted thresholds, rule ids in the same order)
+        self.index = {}
+        self.event_rules = {}
+        for rule_id, rule in enumerate(rules):
+            if rule['metric'] in EVENTS:
+                self.event_rules.setdefault(rule['metric'], []).append(rule_id)
+                continue
+            thresholds, ids = self.index.setdefault(rule['metric'], {}).setdefault(rule['op'], ([], []))
+            position = bisect.bisect_right(thresholds, rule['value'])
+            thresholds.insert(position, rule['value'])
+            ids.insert(position, rule_id)
+        self.last_values = {}  # (ticker, metric) -> value
+        self.pending = {}      # (rule id, ticker) -> time the hold period ends
+        self.last_fired = {}   # (rule id, ticker) -> time
+        self.fired = 0
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def evaluate(self, ticker, payload, now=None):
+        """Update metric state from one market_depth payload and fire any rules that trip"""
+        now = now or time.time()
+        for metric, by_op in self.index.items():
+            value = metric_value(payload, metric)
+            key = (ticker, metric)
+            old = self.last_values.get(key)
+            if value is None:
+                if old is not None:
+                    # Metric undefined (e.g. one side empty): no rule holds, so disarm hold timers;
+                    # once it is defined again every rule that holds activates afresh
+                    del self.last_values[key]
+                    for _, ids in by_op.values():
+                        for rule_id in ids:
+                            self.pending.pop((rule_id, ticker), None)
+                continue
+            if value == old:
+                continue
+            self.last_values[key] = value
+            for op, (thresholds, ids) in by_op.items():
+                activated, deactivated = _crossed(op, thresholds, old, value)
+                for i in activated:
+                    self._activate(ids[i], ticker, payload, now)
+                for i in deactivated:
+                    self.pending.pop((ids[i], ticker), None)
+        if self.pending:
+            self._fire_due(now)
+
+    def on_event(self, event, now=None):
+        """Handle a book event (see order_book.update_order_book), e.g. a spoof detection"""
+        for rule_id in self.event_rules.get(event['type'], ()):
+            rule = self.rules[rule_id]
+            if rule['symbol'] in (None, event['ticker']):
+                self._fire(rule_id, event['ticker'], now or time.time(), value=event.get('qty'),
+                           price=event.get('price'), side=event.get('side'))
+
+    def _activate(self, rule_id, ticker, payload, now):
+        rule = self.rules[rule_id]
+        if rule['symbol'] not in (None, ticker):
+            return
+        if rule['for']:
+            self.pending[(rule_id, ticker)] = now + rule['for']
+        else:
+            self._fire(rule_id, ticker, now, price=self._price(rule, payload))
+
+    def _fire_due(self, now):
+        for key, due in list(self.pending.items()):
+            if due <= now:
+                del self.pending[key]
+                self._fire(key[0], key[1], now)
+
+    @staticmethod
+    def _price(rule, payload):
+        level = payload.get(rule['metric']) if rule['metric'] in ('largest_bid', 'largest_ask') else None
+        return level['price'] if level else None
+
+    def _fire(self, rule_id, ticker, now, value=None, price=None, side=None):
+        rule = self.rules[rule_id]
+        key = (rule_id, ticker)
+        if now - self.last_fired.get(key, float('-inf')) < rule['cooldown']:
+            return
+        self.last_fired[key] = now
+        if value is None:
+            value = self.last_values.get((ticker, rule['metric']))
+        alert = {
+            'rule': rule['name'],
+            'ticker': ticker,
+            'metric': rule['metric'],
+            'value': round(value, 4) if isinstance(value, float) else value,
+            'threshold': rule['value'],
+            'price': price,
+            'side': side,
+            'time': now,
+        }
+        alert['message'] = format_alert(alert)
+        self.fired += 1
+        for sink in self.sinks:
+            try:
+                sink(alert)
+            except Exception as e:
+                print(f"[ALERT] Sink error: {e}")
+
+    def status(self):
+        return {'rules': len(self.rules), 'pending': len(self.pending), 'fired': self.fired}
+
+def format_alert(alert):
+    text = f"{alert['ticker']}: {alert['rule']}"
+    details = []
+    if alert['value'] is not None:
+        details.append(f"value {alert['value']}")
+    if alert['side']:
+        details.append(alert['side'])
+    if alert['price'] is not None:
+        details.append(f"at {alert['price']:.2f}")
+    return f"{text} ({', '.join(details)})" if details else text
+
+def stdout_sink(alert):
+    print(f"[ALERT] {alert['message']}")
+
+class WebhookSink:
+    """Posts alerts as JSON from a background thread so slow endpoints never block the feed"""
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+        self.queue = queue.Queue(maxsize=1000)
+        threading.Thread(target=self._run, name='alert-webhook', daemon=True).start()
+
+    def __call__(self, alert):
+        try:
+            self.queue.put_nowait(alert)
+        except queue.Full:
+            print("[ALERT] Webhook queue full, dropping alert")
+
+    def _run(self):
+        while True:
+            alert = self.queue.get()
+            try:
+                requests.post(self.url, json=alert, timeout=self.timeout)
+            except requests.RequestException as e:
+                print(f"[ALERT] Webhook delivery failed: {e}")
+
+def create_alert_engine():
+    """AlertEngine with stdout (and webhook, if configured) sinks, or None when no rules are set"""
+    rules = load_rules()
+    if not rules:
+        return None
+    engine = AlertEngine(rules)
+    engine.add_sink(stdout_sink)
+    if ALERT_WEBHOOK_URL:
+        engine.add_sink(WebhookSink(ALERT_WEBHOOK_URL))
+    print(f"[ALERT] Loaded {len(rules)} alert rules")
+    return engine
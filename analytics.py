@@ -2,41 +2,68 @@
 import time
 from collections import deque
 
-# Track order flow dynamics
-order_flow_stats = {
-    'new_orders': 0,
-    'cancellations': 0,
-    'executions': 0
-}
-
-# Track recent large orders to detect spoofing
-recent_orders = deque(maxlen=100)
 SPOOF_SIZE_THRESHOLD = 1000  # quantity threshold
 CANCEL_WINDOW_SECONDS = 2
 
-def update_order_flow(old_qty, new_qty):
-    """Update order flow metrics based on quantity change."""
-    if new_qty > old_qty:
-        order_flow_stats['new_orders'] += new_qty - old_qty
-    elif new_qty < old_qty:
-        order_flow_stats['cancellations'] += old_qty - new_qty
-        # treat remaining qty decrease as execution
-        order_flow_stats['executions'] += old_qty - new_qty
-
-def record_large_order(price, qty, side, timestamp):
-    """Store large orders to monitor potential spoofing."""
-    if qty >= SPOOF_SIZE_THRESHOLD:
-        recent_orders.append({'price': price, 'qty': qty, 'side': side, 'time': timestamp})
-
-def detect_spoofing(price, qty, side, timestamp):
-    """Check if a large order was cancelled quickly."""
-    suspicious = False
-    for order in list(recent_orders):
-        if (order['side'] == side and order['price'] == price and
-                timestamp - order['time'] <= CANCEL_WINDOW_SECONDS and
-                qty < order['qty'] * 0.2):
-            suspicious = True
-    return suspicious
+class FlowAnalytics:
+    """Order flow counters and recent large orders for one set of books"""
+
+    def __init__(self):
+        # Track order flow dynamics
+        self.order_flow_stats = {
+            'new_orders': 0,
+            'cancellations': 0,
+            'executions': 0
+        }
+        # Track recent large orders to detect spoofing
+        self.recent_orders = deque(maxlen=100)
+
+    def update_order_flow(self, old_qty, new_qty):
+        """Update order flow metrics based on quantity change."""
+        if new_qty > old_qty:
+            self.order_flow_stats['new_orders'] += new_qty - old_qty
+        elif new_qty < old_qty:
+            self.order_flow_stats['cancellations'] += old_qty - new_qty
+            # treat remaining qty decrease as execution
+            self.order_flow_stats['executions'] += old_qty - new_qty
+
+    def record_large_order(self, price, qty, side, timestamp):
+        """Store large orders to monitor potential spoofing."""
+        if qty >= SPOOF_SIZE_THRESHOLD:
+            self.recent_orders.append({'price': price, 'qty': qty, 'side': side, 'time': timestamp})
+
+    def detect_spoofing(self, price, qty, side, timestamp):
+        """Check if a large order was cancelled quickly."""
+        suspicious = False
+        for order in list(self.recent_orders):
+            if (order['side'] == side and order['price'] == price and
+                    timestamp - order['time'] <= CANCEL_WINDOW_SECONDS and
+                    qty < order['qty'] * 0.2):
+                suspicious = True
+        return suspicious
+
+    def get_state(self):
+        """Snapshot analytics state for checkpoints"""
+        return {
+            'order_flow_stats': dict(self.order_flow_stats),
+            'recent_orders': list(self.recent_orders),
+        }
+
+    def restore_state(self, state):
+        """Restore analytics state captured by get_state()"""
+        self.order_flow_stats.update(state.get('order_flow_stats', {}))
+        self.recent_orders.clear()
+        self.recent_orders.extend(state.get('recent_orders', []))
+
+# The web app's books share this instance; embedders can keep their own
+default_analytics = FlowAnalytics()
+order_flow_stats = default_analytics.order_flow_stats
+recent_orders = default_analytics.recent_orders
+update_order_flow = default_analytics.update_order_flow
+record_large_order = default_analytics.record_large_order
+detect_spoofing = default_analytics.detect_spoofing
+get_state = default_analytics.get_state
+restore_state = default_analytics.restore_state
 
 def largest_order(bids, asks):
     """Return the largest bid and ask orders."""
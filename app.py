@@ -1,23 +1,46 @@
 import os
-import json
 import time
 import asyncio
-import websockets
+import threading
 import re
 from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, join_room
 from dotenv import load_dotenv
-import msg_pb2
-from database import init_db, authenticate_user, get_auth_token, upsert_auth, find_user_by_username, get_auth_data
-from auth_utils import authenticate_broker, handle_auth_success, mask_api_credential
-from analytics import (
-    update_order_flow,
-    record_large_order,
-    detect_spoofing,
-    largest_order,
-    spread_opportunity,
-    order_flow_stats,
+from database import (
+    ensure_db,
+    authenticate_user,
+    get_auth_token,
+    upsert_auth,
+    find_user_by_username,
+    get_auth_data,
+    get_active_auth_name,
 )
+from auth_utils import authenticate_broker, handle_auth_success, mask_api_credential, broker_user_id
+from analytics import get_state as get_analytics_state, restore_state as restore_analytics_state
+from order_book import (
+    order_books,
+    process_market_depth,
+    apply_market_depth,
+    build_depth_payload,
+    set_verbose,
+    set_analytics,
+)
+from heatmap import sample_heatmap
+from feed_connection import ConnectionManager, run_session
+from feed_decoder import decode_market_depth
+from decode_pool import DECODE_WORKERS, DecodePool
+from feed_shards import FEED_CONNECTIONS, ShardedFeed
+from book_checkpoint import CHECKPOINT_DIR, Checkpointer
+from alerts import create_alert_engine
+from latency import LatencyTracker
+from history import HistoryStore, RESOLUTIONS
+from option_chain import create_option_chain
+from synthetics import create_synthetic_engine
+from profiler import (PROFILING, PROFILE_SECONDS, PROFILE_INTERVAL_MS, PROFILE_MAX_SECONDS, FEED_THREAD_NAME,
+                      Profiler, install_signal_handler)
+from overload import OverloadController, NORMAL, SHED_ANALYTICS
+from feed_manager import PER_USER_FEEDS, FeedManager, user_room
+from token_store import TOKEN_STORE_URL, get_token_store
 
 # Load environment variables
 load_dotenv()
@@ -25,6 +48,8 @@ load_dotenv()
 # Configuration
 WEBSOCKET_URL = os.getenv('WEBSOCKET_URL', 'wss://rtsocket-api.fyers.in/versova').strip("'")
 SYMBOL = os.getenv('SYMBOL', 'NSE:NIFTY25JULFUT').strip("'")
+# Extra symbols streamed alongside SYMBOL (comma separated)
+WATCHLIST = [s.strip() for s in os.getenv('WATCHLIST', '').strip("'").split(',') if s.strip()]
 LOT_SIZE = int(os.getenv('LOT_SIZE', '50'))
 
 # Broker Configuration
@@ -34,490 +59,343 @@ REDIRECT_URL = os.getenv('REDIRECT_URL', 'http://localhost:5000/fyers/callback')
 
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-change-in-production')
-socketio = SocketIO(app, cors_allowed_origins="*")
-
-# Initialize database
-init_db()
+# With a Redis token store, emits also go through Redis so every instance's clients get them
+socketio = SocketIO(app, cors_allowed_origins="*",
+                    message_queue=TOKEN_STORE_URL if TOKEN_STORE_URL.startswith(('redis://', 'rediss://')) else None)
 
-# Global order book storage for maintaining full depth
-order_books = {}
 ws_loop = None  # Event loop for WebSocket thread
 
-def update_order_book(ticker, bids, asks, tbq, tsq, timestamp, is_snapshot):
-    """Enhanced order book update with guaranteed 50-level depth maintenance"""
-    global order_books
-    
-    if ticker not in order_books:
-        # Initialize empty order book with 50 levels
-        order_books[ticker] = {
-            'bids': {i: {'price': 0.0, 'qty': 0, 'orders': 0, 'level': i} for i in range(50)},
-            'asks': {i: {'price': 0.0, 'qty': 0, 'orders': 0, 'level': i} for i in range(50)},
-            'tbq': 0,
-            'tsq': 0,
-            'timestamp': 0,
-            'initialized': False
-        }
-    
-    # Update total quantities and timestamp
-    order_books[ticker]['tbq'] = tbq
-    order_books[ticker]['tsq'] = tsq
-    order_books[ticker]['timestamp'] = timestamp
-    
-    # Check if this is truly the first update
-    first_update = not order_books[ticker].get('initialized', False)
-    
-    if is_snapshot or first_update:
-        if first_update:
-            print(f"[SNAPSHOT] FIRST UPDATE: Initializing order book for {ticker}")
-            # Only reset on very first update
-            for i in range(50):
-                order_books[ticker]['bids'][i] = {'price': 0.0, 'qty': 0, 'orders': 0, 'level': i}
-                order_books[ticker]['asks'][i] = {'price': 0.0, 'qty': 0, 'orders': 0, 'level': i}
-        else:
-            print(f"[SNAPSHOT] SNAPSHOT: Updating order book for {ticker}")
-    else:
-        print(f"[INCREMENTAL] INCREMENTAL: Updating {len(bids)} bid levels and {len(asks)} ask levels for {ticker}")
-    
-    # Process bid updates
-    for bid in bids:
-        level = bid['level']
-        if 0 <= level < 50:
-            old_data = order_books[ticker]['bids'][level]
-            update_order_flow(old_data['qty'], bid['qty'])
-            if bid['qty'] > old_data['qty']:
-                record_large_order(bid['price'], bid['qty'], 'bid', timestamp)
-            elif bid['qty'] < old_data['qty']:
-                if detect_spoofing(bid['price'], bid['qty'], 'bid', timestamp):
-                    print(f"[SPOOFING] Potential bid spoof at {bid['price']}")
-            
-            if bid['price'] == 0.0 and bid['qty'] > 0:
-                if old_data['price'] > 0:
-                    order_books[ticker]['bids'][level] = {
-                        'price': old_data['price'], 
-                        'qty': bid['qty'],
-                        'orders': bid['orders'], 
-                        'level': level
-                    }
-                    # Only log invalid data occasionally to reduce noise
-                    if level % 10 == 0:  # Log every 10th level only
-                        print(f"   [BID] Level {level}: Invalid data corrected (price preserved)")
-                # Skip invalid updates without valid old price
-            elif bid['qty'] == 0:
-                if bid['price'] == 0.0 and old_data['price'] > 0:
-                    order_books[ticker]['bids'][level] = {
-                        'price': old_data['price'], 
-                        'qty': 0, 
-                        'orders': bid['orders'], 
-                        'level': level
-                    }
-                    print(f"   [BID] BID Level {level}: {old_data['price']:.2f} qty:0 orders:{bid['orders']} (preserving level)")
-                elif bid['price'] > 0:
-                    order_books[ticker]['bids'][level] = bid
-                    print(f"   [BID] BID Level {level}: {bid['price']:.2f} qty:0 orders:{bid['orders']} (was {old_data['price']:.2f} qty:{old_data['qty']:,})")
-                else:
-                    if old_data['price'] == 0.0:
-                        order_books[ticker]['bids'][level] = {'price': 0.0, 'qty': 0, 'orders': 0, 'level': level}
-                    else:
-                        order_books[ticker]['bids'][level] = {
-                            'price': old_data['price'], 
-                            'qty': 0, 
-                            'orders': bid['orders'], 
-                            'level': level
-                        }
-                        print(f"   [BID] BID Level {level}: {old_data['price']:.2f} qty:0 orders:{bid['orders']} (preserving structure)")
-            else:
-                order_books[ticker]['bids'][level] = bid
-                if old_data['price'] != bid['price'] or old_data['qty'] != bid['qty']:
-                    print(f"   [BID] BID Level {level}: {bid['price']:.2f} qty:{bid['qty']:,} orders:{bid['orders']} (was {old_data['price']:.2f} qty:{old_data['qty']:,})")
-    
-    # Process ask updates
-    for ask in asks:
-        level = ask['level']
-        if 0 <= level < 50:
-            old_data = order_books[ticker]['asks'][level]
-            update_order_flow(old_data['qty'], ask['qty'])
-            if ask['qty'] > old_data['qty']:
-                record_large_order(ask['price'], ask['qty'], 'ask', timestamp)
-            elif ask['qty'] < old_data['qty']:
-                if detect_spoofing(ask['price'], ask['qty'], 'ask', timestamp):
-                    print(f"[SPOOFING] Potential ask spoof at {ask['price']}")
-            
-            if ask['price'] == 0.0 and ask['qty'] > 0:
-                if old_data['price'] > 0:
-                    order_books[ticker]['asks'][level] = {
-                        'price': old_data['price'], 
-                        'qty': ask['qty'],
-                        'orders': ask['orders'], 
-                        'level': level
-                    }
-                    # Only log invalid data occasionally to reduce noise
-                    if level % 10 == 0:  # Log every 10th level only
-                        print(f"   [ASK] Level {level}: Invalid data corrected (price preserved)")
-                # Skip invalid updates without valid old price
-            elif ask['qty'] == 0:
-                if ask['price'] == 0.0 and old_data['price'] > 0:
-                    order_books[ticker]['asks'][level] = {
-                        'price': old_data['price'], 
-                        'qty': 0, 
-                        'orders': ask['orders'], 
-                        'level': level
-                    }
-                    print(f"   [ASK] ASK Level {level}: {old_data['price']:.2f} qty:0 orders:{ask['orders']} (preserving level)")
-                elif ask['price'] > 0:
-                    order_books[ticker]['asks'][level] = ask
-                    print(f"   [ASK] ASK Level {level}: {ask['price']:.2f} qty:0 orders:{ask['orders']} (was {old_data['price']:.2f} qty:{old_data['qty']:,})")
-                else:
-                    if old_data['price'] == 0.0:
-                        order_books[ticker]['asks'][level] = {'price': 0.0, 'qty': 0, 'orders': 0, 'level': level}
-                    else:
-                        order_books[ticker]['asks'][level] = {
-                            'price': old_data['price'], 
-                            'qty': 0, 
-                            'orders': ask['orders'], 
-                            'level': level
-                        }
-                        print(f"   [ASK] ASK Level {level}: {old_data['price']:.2f} qty:0 orders:{ask['orders']} (preserving structure)")
-            else:
-                order_books[ticker]['asks'][level] = ask
-                if old_data['price'] != ask['price'] or old_data['qty'] != ask['qty']:
-                    print(f"   [ASK] ASK Level {level}: {ask['price']:.2f} qty:{ask['qty']:,} orders:{ask['orders']} (was {old_data['price']:.2f} qty:{old_data['qty']:,})")
-    
-    # Mark as initialized after processing updates
-    order_books[ticker]['initialized'] = True
-    
-    # Post-update validation
-    active_bids = len([b for b in order_books[ticker]['bids'].values() if b['price'] > 0])
-    active_asks = len([a for a in order_books[ticker]['asks'].values() if a['price'] > 0])
-    
-    print(f"   [STATUS] Update complete: {active_bids} active bid levels, {active_asks} active ask levels")
-
-def get_full_order_book(ticker):
-    """Get the complete 50-level order book for display with proper depth reconstruction"""
-    if ticker not in order_books:
-        return None
-    
-    book = order_books[ticker]
-    
-    # Get all bid levels with valid prices, sorted by price (descending for bids)
-    raw_bids = []
-    for i in range(50):
-        bid = book['bids'][i]
-        if bid['price'] > 0:
-            raw_bids.append({
-                'price': bid['price'],
-                'qty': bid['qty'], 
-                'orders': bid['orders'],
-                'level': len(raw_bids)
-            })
-    
-    # Sort bids by price (highest first) and reassign levels
-    raw_bids.sort(key=lambda x: x['price'], reverse=True)
-    active_bids = []
-    for i, bid in enumerate(raw_bids[:50]):
-        active_bids.append({
-            'price': bid['price'],
-            'qty': bid['qty'],
-            'orders': bid['orders'],
-            'level': i
-        })
-    
-    # Get all ask levels with valid prices, sorted by price (ascending for asks)
-    raw_asks = []
-    for i in range(50):
-        ask = book['asks'][i]
-        if ask['price'] > 0:
-            raw_asks.append({
-                'price': ask['price'],
-                'qty': ask['qty'],
-                'orders': ask['orders'],
-                'level': len(raw_asks)
-            })
-    
-    # Sort asks by price (lowest first) and reassign levels
-    raw_asks.sort(key=lambda x: x['price'])
-    active_asks = []
-    for i, ask in enumerate(raw_asks[:50]):
-        active_asks.append({
-            'price': ask['price'],
-            'qty': ask['qty'],
-            'orders': ask['orders'],
-            'level': i
-        })
-    
-    return {
-        'ticker': ticker,
-        'tbq': book['tbq'],
-        'tsq': book['tsq'],
-        'timestamp': book['timestamp'],
-        'bids': active_bids,
-        'asks': active_asks,
-        'bidprice': [bid['price'] for bid in active_bids],
-        'askprice': [ask['price'] for ask in active_asks],
-        'bidqty': [bid['qty'] for bid in active_bids],
-        'askqty': [ask['qty'] for ask in active_asks],
-        'bidordn': [bid['orders'] for bid in active_bids],
-        'askordn': [ask['orders'] for ask in active_asks]
-    }
-
-def calculate_order_book_imbalance(bids, asks, depth):
-    """Calculate order book imbalance at specified depth level"""
-    try:
-        # Get quantities up to specified depth
-        bid_qty = sum(bid['qty'] for bid in bids[:depth])
-        ask_qty = sum(ask['qty'] for ask in asks[:depth])
-        
-        # Calculate imbalance ratio
-        total_qty = bid_qty + ask_qty
-        if total_qty > 0:
-            imbalance = (bid_qty - ask_qty) / total_qty
-            imbalance_pct = imbalance * 100
-        else:
-            imbalance = 0
-            imbalance_pct = 0
-        
-        return {
-            'bid_qty': bid_qty,
-            'ask_qty': ask_qty,
-            'imbalance': imbalance,
-            'imbalance_pct': imbalance_pct,
-            'interpretation': interpret_imbalance(imbalance_pct)
-        }
-    except Exception as e:
-        print(f"Error calculating imbalance: {e}")
-        return {
-            'bid_qty': 0,
-            'ask_qty': 0,
-            'imbalance': 0,
-            'imbalance_pct': 0,
-            'interpretation': 'Unknown'
-        }
-
-def interpret_imbalance(imbalance_pct):
-    """Interpret the imbalance percentage"""
-    if imbalance_pct > 30:
-        return "Strong Buying Pressure"
-    elif imbalance_pct > 15:
-        return "Moderate Buying Pressure"
-    elif imbalance_pct > 5:
-        return "Slight Buying Pressure"
-    elif imbalance_pct < -30:
-        return "Strong Selling Pressure"
-    elif imbalance_pct < -15:
-        return "Moderate Selling Pressure"
-    elif imbalance_pct < -5:
-        return "Slight Selling Pressure"
-    else:
-        return "Balanced"
-
-def process_market_depth(message_bytes):
-    """Process market depth protobuf message with proper order book management"""
-    try:
-        socket_message = msg_pb2.SocketMessage()
-        socket_message.ParseFromString(message_bytes)
-        
-        if socket_message.error:
-            print(f"Error in socket message: {socket_message.msg}")
-            return None
-            
-        market_data = {}
-        for ticker, feed in socket_message.feeds.items():
-            # Extract raw update data
-            timestamp = feed.feed_time.value if feed.feed_time else None
-            tbq = feed.depth.tbq.value if feed.depth.tbq else 0
-            tsq = feed.depth.tsq.value if feed.depth.tsq else 0
-            is_snapshot = socket_message.snapshot
-            
-            # Process bids from update
-            update_bids = []
-            for bid in feed.depth.bids:
-                bid_data = {
-                    'price': bid.price.value / 100.0,
-                    'qty': bid.qty.value,
-                    'orders': bid.nord.value,
-                    'level': bid.num.value
-                }
-                update_bids.append(bid_data)
-            
-            # Process asks from update
-            update_asks = []
-            for ask in feed.depth.asks:
-                ask_data = {
-                    'price': ask.price.value / 100.0,
-                    'qty': ask.qty.value,
-                    'orders': ask.nord.value,
-                    'level': ask.num.value
-                }
-                update_asks.append(ask_data)
-            
-            # Update the order book
-            update_order_book(ticker, update_bids, update_asks, tbq, tsq, timestamp, is_snapshot)
-            
-            # Get the complete order book for display
-            full_book = get_full_order_book(ticker)
-            if full_book:
-                largest_bid, largest_ask = largest_order(full_book['bids'], full_book['asks'])
-                opp, spread_bps = spread_opportunity(
-                    full_book['bids'][0] if full_book['bids'] else None,
-                    full_book['asks'][0] if full_book['asks'] else None,
-                )
-                # Transform data structure to match frontend expectations
-                frontend_data = {
-                    'ticker': full_book['ticker'],
-                    'timestamp': full_book['timestamp'] * 1000,
-                    'total_bid_qty': full_book['tbq'],
-                    'total_sell_qty': full_book['tsq'],
-                    'bids': [
-                        {
-                            'level': bid['level'],
-                            'price': bid['price'],
-                            'quantity': bid['qty'],
-                            'orders': bid['orders']
-                        }
-                        for bid in full_book['bids']
-                    ],
-                    'asks': [
-                        {
-                            'level': ask['level'],
-                            'price': ask['price'],
-                            'quantity': ask['qty'],
-                            'orders': ask['orders']
-                        }
-                        for ask in full_book['asks']
-                    ],
-                    'bidprice': full_book['bidprice'],
-                    'askprice': full_book['askprice'],
-                    'bidqty': full_book['bidqty'],
-                    'askqty': full_book['askqty'],
-                    'bidordn': full_book['bidordn'],
-                    'askordn': full_book['askordn'],
-                    # Calculate imbalances at different depths
-                    'imbalance_10': calculate_order_book_imbalance(full_book['bids'], full_book['asks'], 10),
-                    'imbalance_20': calculate_order_book_imbalance(full_book['bids'], full_book['asks'], 20),
-                    'imbalance_50': calculate_order_book_imbalance(full_book['bids'], full_book['asks'], 50),
-                    'largest_bid': largest_bid,
-                    'largest_ask': largest_ask,
-                    'spread_bps': spread_bps,
-                    'opportunity': opp,
-                    'order_flow': dict(order_flow_stats),
-                }
-                
-                market_data[ticker] = frontend_data
-        
-        return market_data if len(market_data) > 0 else None
-    except Exception as e:
-        print(f"Error processing market depth: {e}")
-        return None
-
-async def subscribe_symbols():
-    """Subscribe to market depth data for symbols"""
+async def subscribe_symbols(symbols=None):
+    """Subscribe to market depth data for all active (or the given) symbols in one message"""
     try:
-        subscribe_msg = {
-            "type": 1,
-            "data": {
-                "subs": 1,
-                "symbols": [SYMBOL],
-                "mode": "depth",
-                "channel": "1"
-            }
-        }
+        subscribe_msg, resume_msg = feed.subscribe_messages(symbols)
         
         print(f"\n=== Sending Subscribe Message ===")
-        print(f"Message: {json.dumps(subscribe_msg, indent=2)}")
+        print(f"Message: {subscribe_msg}")
         
         if websocket:
-            await websocket.send(json.dumps(subscribe_msg))
+            await websocket.send(subscribe_msg)
             print("Subscribe message sent successfully")
             
-            resume_msg = {
-                "type": 2,
-                "data": {
-                    "resumeChannels": ["1"],
-                    "pauseChannels": []
-                }
-            }
-            
-            await websocket.send(json.dumps(resume_msg))
+            await websocket.send(resume_msg)
             print("Channel resume message sent successfully")
             
     except Exception as e:
         print(f"Error in subscribe_symbols: {e}")
 
+def on_feed_state(status):
+    """Broadcast feed health; while not connected keep serving the last book marked stale"""
+    print(f"[FEED] State: {status['state']}")
+    socketio.emit('feed_status', status)
+    if status['stale'] and last_market_data:
+        socketio.emit('market_depth', {
+            ticker: dict(depth, stale=True) for ticker, depth in last_market_data.items()
+        })
+
 websocket = None
-last_ping_time = 0
+decode_pool = None  # Started by run_websocket when DECODE_WORKERS > 0
+checkpointer = None  # Started on the feed thread when CHECKPOINT_DIR is set
+# Option-chain mode (OPTION_CHAIN_*): every strike is subscribed and kept in a columnar table
+option_chain = create_option_chain()
+
+# Calendar spreads / basis over subscribed symbols (SYNTHETICS)
+synthetics = create_synthetic_engine()
+
+def feed_symbols():
+    """Everything the feed should be subscribed to"""
+    symbols = [SYMBOL] + WATCHLIST
+    if option_chain:
+        symbols += option_chain.symbols
+    if synthetics:
+        symbols += synthetics.symbols
+    return list(dict.fromkeys(symbols))
+
+feed = ConnectionManager(feed_symbols())
+# PER_USER_FEEDS: one isolated feed and book set per logged-in account instead of the shared feed
+feed_manager = FeedManager(WEBSOCKET_URL, [SYMBOL] + WATCHLIST,
+                           lambda event, data, room: socketio.emit(event, data, to=room)) if PER_USER_FEEDS else None
+feed.add_listener(on_feed_state)
+sharded_feed = ShardedFeed(WEBSOCKET_URL)
+# Last emitted payload per ticker, re-served (marked stale) during outages
+last_market_data = {}
+# Per-message exchange -> broker -> us delays and clock offset
+latency = LatencyTracker()
+# Downsampled imbalance/spread/microprice history served by /api/history
+history = HistoryStore()
+# On-demand CPU/allocation captures of the feed thread (PROFILING=1)
+profiler = Profiler()
+# None unless ALERT_RULES / ALERT_RULES_FILE define rules
+alert_engine = create_alert_engine()
+if alert_engine:
+    alert_engine.add_sink(lambda alert: socketio.emit('alert', alert))
+# Sheds logging/analytics, then emit rate, then hidden symbols when the feed falls behind
+overload = OverloadController()
+
+def on_overload_change(status):
+    verbose = status['level'] == NORMAL
+    set_verbose(verbose)
+    set_analytics(verbose)
+    socketio.emit('overload', status)
+
+overload.add_listener(on_overload_change)
+
+def backlog():
+    """Frames received but not yet applied to the books"""
+    depth = len(getattr(websocket, 'messages', None) or ())
+    if decode_pool:
+        depth += len(decode_pool.pending)
+    if sharded_feed.queue is not None:
+        try:
+            depth += sharded_feed.queue.qsize()
+        except NotImplementedError:
+            pass  # macOS multiprocessing queues have no qsize
+    return depth
+
+def on_book_update(ticker, book):
+    """Option strikes go into the chain table; only the displayed one also gets a full payload.
+
+    Also samples how long this update waited between coming off the socket and
+    reaching the book, and under overload defers (conflates) or drops the
+    payload - the book itself is already updated.
+    """
+    received = book.get('received')
+    if received:
+        overload.sample_lag((time.time() - received) * 1000)
+    if synthetics:
+        synthetics.on_book(ticker, book)
+    if option_chain and option_chain.update(ticker, book):
+        if ticker != SYMBOL:
+            return False
+    return overload.wants_payload(ticker, ticker == SYMBOL)
+
+def publish_option_chain():
+    chain = option_chain.due()
+    if chain:
+        socketio.emit('option_chain', chain)
+
+def publish_market_data(market_data, events=None):
+    """Emit processed books and any due heatmap columns to the frontend, then run alert rules"""
+    if alert_engine and events:
+        for event in events:
+            alert_engine.on_event(event)
+    if option_chain:
+        publish_option_chain()
+    if synthetics:
+        changed = synthetics.pop_changed()
+        if changed:
+            socketio.emit('synthetics', changed)
+    if overload.pending:
+        # Conflated symbols: one payload from the current book once their interval is up
+        market_data = dict(market_data or {})
+        for ticker in overload.due_tickers():
+            if ticker in order_books:
+                market_data[ticker] = build_depth_payload(ticker)
+    if not market_data:
+        return
+    if websocket is not None:
+        latency.set_rtt(getattr(websocket, 'latency', None))
+    for ticker, depth in market_data.items():
+        latency.annotate(ticker, depth)
+    shedding = overload.level >= SHED_ANALYTICS
+    if not shedding:
+        print(f"[EMIT] Emitting market_depth data to frontend with {len(market_data)} symbols")
+    socketio.emit('market_depth', market_data)
+    last_market_data.update(market_data)
+    for ticker, depth in market_data.items():
+        if not shedding:
+            column = sample_heatmap(ticker, depth['bidprice'], depth['bidqty'],
+                                    depth['askprice'], depth['askqty'])
+            if column:
+                socketio.emit('depth_heatmap', column)
+        history.record(ticker, depth)
+        if alert_engine:
+            alert_engine.evaluate(ticker, depth)
+
+def apply_decoded_frame(updates):
+    """Apply a columnar frame decoded by a worker process and publish it"""
+    if updates:
+        events = []
+        if profiler.tracing:
+            with profiler.stage('apply_market_depth'):
+                market_data = apply_market_depth(updates, events=events, on_update=on_book_update)
+            with profiler.stage('publish_market_data'):
+                publish_market_data(market_data, events)
+        else:
+            market_data = apply_market_depth(updates, events=events, on_update=on_book_update)
+            publish_market_data(market_data, events)
+
+def on_frame(message_bytes, received=None):
+    overload.sample_queue(backlog())
+    if checkpointer:
+        checkpointer.record(message_bytes)
+    if decode_pool:
+        decode_pool.submit(message_bytes, received)
+    elif profiler.tracing:
+        events = []
+        with profiler.stage('process_market_depth'):
+            market_data = process_market_depth(message_bytes, events, on_book_update, received)
+        with profiler.stage('publish_market_data'):
+            publish_market_data(market_data, events)
+    else:
+        events = []
+        publish_market_data(process_market_depth(message_bytes, events, on_book_update, received), events)
+    if checkpointer and checkpointer.due():
+        take_checkpoint()
+
+def take_checkpoint():
+    """Checkpoint the books once every journaled frame has been applied.
+
+    With the decode pool the capture is deferred to the point where the pool
+    has applied exactly the frames journaled so far, so the feed loop never
+    waits on the workers.
+    """
+    if not decode_pool:
+        checkpointer.checkpoint(order_books, get_analytics_state())
+        return
+    gen = checkpointer.begin()
+    if gen is not None:
+        decode_pool.call_after_applied(
+            lambda: checkpointer.commit(order_books, get_analytics_state(), gen))
+
+def start_checkpointing():
+    """Open the journal and warm-start the books from the latest checkpoint + journal replay"""
+    global checkpointer
+    if not CHECKPOINT_DIR:
+        return
+    checkpointer = Checkpointer(CHECKPOINT_DIR)
+    try:
+        restored = checkpointer.load()
+    except Exception as e:
+        print(f"[CHECKPOINT] Could not load checkpoint: {e}")
+        return
+    if not restored:
+        return
+    
+    started = time.time()
+    books, analytics_state, frames = restored
+    order_books.clear()
+    order_books.update(books)
+    if analytics_state:
+        restore_analytics_state(analytics_state)
+    
+    replayed = 0
+    for frame in frames:
+        try:
+            updates = decode_market_depth(frame)
+            if updates:
+                # Quietly, and without per-frame payloads: those are built once below
+                apply_market_depth(updates, on_update=lambda ticker, book: False, verbose=False)
+            replayed += 1
+        except Exception as e:
+            print(f"[CHECKPOINT] Skipping unreadable journal frame: {e}")
+    
+    for ticker in order_books:
+        payload = build_depth_payload(ticker)
+        if payload:
+            last_market_data[ticker] = payload
+    print(f"[CHECKPOINT] Restored {len(order_books)} books and replayed {replayed} frames "
+          f"in {(time.time() - started) * 1000:.0f} ms")
+
+def get_feed_auth_header():
+    """Build the feed Authorization header from cached auth data, or None if not logged in"""
+    # Get auth data (cached in memory) - only proceed if user is logged in
+    active_name = get_active_auth_name('fyers')
+    
+    if not active_name:
+        print("No active authentication found in database, waiting for login...")
+        return None
+    
+    # Get all auth data including API key and auth token
+    auth_data = get_auth_data(active_name)
+    
+    if not auth_data or not auth_data['auth_token'] or not auth_data['api_key']:
+        print("No valid auth data available, waiting...")
+        return None
+    
+    print(f"WebSocket URL: {WEBSOCKET_URL}")
+    print(f"App ID: {auth_data['api_key']}")
+    print(f"User: {active_name}")
+    print(f"Broker: {auth_data['broker']}")
+    return f"{auth_data['api_key']}:{auth_data['auth_token']}"
+
+def set_websocket(ws):
+    global websocket
+    websocket = ws
 
 async def websocket_client():
-    global websocket, last_ping_time
+    global websocket
     
     while True:
+        clean_close = False
         try:
-            # Get auth data from database - only proceed if user is logged in
-            from database import db_session, Auth
-            active_auth = db_session.query(Auth).filter_by(is_revoked=False, broker='fyers').first()
-            
-            if not active_auth:
-                print("No active authentication found in database, waiting for login...")
+            auth_header = get_feed_auth_header()
+            if not auth_header:
                 await asyncio.sleep(10)
                 continue
             
-            # Get all auth data including API key and auth token
-            auth_data = get_auth_data(active_auth.name)
-            
-            if not auth_data or not auth_data['auth_token'] or not auth_data['api_key']:
-                print("No valid auth data available, waiting...")
-                await asyncio.sleep(10)
-                continue
-                
             print("\n=== Attempting WebSocket Connection ===")
-            auth_header = f"{auth_data['api_key']}:{auth_data['auth_token']}"
-            
-            print(f"WebSocket URL: {WEBSOCKET_URL}")
-            print(f"App ID: {auth_data['api_key']}")
-            print(f"User: {active_auth.name}")
-            print(f"Broker: {auth_data['broker']}")
-            
-            async with websockets.connect(
-                WEBSOCKET_URL,
-                extra_headers={
-                    "Authorization": auth_header
-                }
-            ) as ws:
-                websocket = ws
-                print("WebSocket connection established!")
-                
-                # Subscribe to symbols
-                await subscribe_symbols()
-                last_ping_time = time.time()
-                
-                while True:
-                    try:
-                        # Send ping every 30 seconds
-                        current_time = time.time()
-                        if current_time - last_ping_time >= 30:
-                            await ws.send("ping")
-                            last_ping_time = current_time
-                            print("Ping sent")
-                        
-                        message = await ws.recv()
-                        if isinstance(message, bytes):
-                            market_data = process_market_depth(message)
-                            if market_data:
-                                print(f"[EMIT] Emitting market_depth data to frontend with {len(market_data)} symbols")
-                                socketio.emit('market_depth', market_data)
-                        else:
-                            print(f"Received text message: {message}")
-                            
-                    except websockets.ConnectionClosed:
-                        print("WebSocket connection closed")
-                        break
-                    except Exception as e:
-                        print(f"Error processing message: {e}")
+            clean_close = await run_session(WEBSOCKET_URL, auth_header, feed, on_frame, on_open=set_websocket)
                         
         except Exception as e:
             print(f"\n=== Connection Error ===")
             print(f"Error: {str(e)}")
-            
-        print("\nRetrying connection in 5 seconds...")
-        await asyncio.sleep(5)
+        
+        websocket = None
+        delay = feed.on_disconnected(clean_close)
+        print(f"\nRetrying connection in {delay:.2f} seconds...")
+        await asyncio.sleep(delay)
+
+# Set on any login, re-login or logout (from any instance); shards only see
+# the credentials they were spawned with, so the sharded feed re-checks them
+auth_changed = threading.Event()
+
+def on_token_message(message):
+    if message.get('type') == 'auth':
+        auth_changed.set()
+
+def run_sharded_feed():
+    """Run the feed over FEED_CONNECTIONS worker processes and merge into the shared books"""
+    threading.current_thread().name = FEED_THREAD_NAME
+    ensure_db()
+    get_token_store().subscribe(on_token_message)
+    # Shards do not journal raw frames, so a warm start restores the last checkpoint only
+    start_checkpointing()
+    while True:
+        auth_changed.clear()
+        auth_header = get_feed_auth_header()
+        if not auth_header:
+            # Logged out: drop the connections made with the old credentials
+            sharded_feed.stop()
+            auth_changed.wait(10)
+            continue
+        
+        sharded_feed.start(auth_header, list(feed.subscriptions))
+        while not sharded_feed.restart_pending:
+            if auth_changed.is_set():
+                auth_changed.clear()
+                if get_feed_auth_header() != auth_header:
+                    print("[SHARDS] Credentials changed, restarting feed connections")
+                    break
+            item = sharded_feed.get(timeout=overload.emit_interval)
+            if item is None:
+                flush_conflated()
+                continue
+            kind, shard_id, payload = item
+            if kind == 'updates':
+                overload.sample_queue(backlog())
+                try:
+                    apply_decoded_frame(payload)
+                except Exception as e:
+                    print(f"Error applying shard {shard_id} updates: {e}")
+                if checkpointer and checkpointer.due():
+                    take_checkpoint()
+            elif kind == 'status':
+                feed.set_state(sharded_feed.update_state(shard_id, payload['state']))
+
+@app.before_request
+def prepare_database():
+    """Create/upgrade the schema on the first request rather than at import"""
+    ensure_db()
 
 # Authentication Routes
 @app.route('/')
@@ -579,8 +457,11 @@ def fyers_callback():
     auth_token, error_message = authenticate_broker(auth_code)
     
     if auth_token:
-        username = session['user']
-        success = handle_auth_success(auth_token, username, 'fyers')
+        user_id = broker_user_id(auth_token)
+        if user_id:
+            session['broker_user'] = user_id
+        username = session_auth_name()
+        success = handle_auth_success(auth_token, username, 'fyers', user_id=user_id)
         
         if success:
             session['logged_in'] = True
@@ -605,20 +486,20 @@ def dashboard():
     if 'user' not in session:
         session['user'] = 'fyers_user'
     
-    username = session['user']
+    username = session_auth_name()
     auth_token = get_auth_token(username)
     
     if not auth_token:
         session.pop('logged_in', None)
         return redirect(url_for('broker_login'))
     
-    return render_template('dashboard.html', symbol=SYMBOL, lot_size=LOT_SIZE)
+    return render_template('dashboard.html', symbol=current_symbol(), lot_size=LOT_SIZE)
 
 @app.route('/auth/logout')
 def logout():
     """Logout route"""
     if session.get('logged_in'):
-        username = session.get('user')
+        username = session_auth_name()
         if username:
             upsert_auth(username, "", "fyers", revoke=True)
             print(f'Auth token revoked for user: {username}')
@@ -626,14 +507,130 @@ def logout():
     session.clear()
     return redirect(url_for('broker_login'))
 
+def session_auth_name():
+    """This session's Auth row: the Fyers account (fy_id) with PER_USER_FEEDS, otherwise the app user.
+
+    Per-user feeds, rooms and symbols are keyed on the same name.
+    """
+    if feed_manager and session.get('broker_user'):
+        return session['broker_user']
+    return session.get('user')
+
+def current_symbol():
+    """The displayed symbol: per user with PER_USER_FEEDS, otherwise the shared SYMBOL"""
+    name = session_auth_name()
+    if feed_manager and name:
+        return feed_manager.symbols(name)[0]
+    return SYMBOL
+
 @app.route('/api/config')
 def get_config():
     """Get application configuration including symbol"""
     return {
-        'symbol': SYMBOL,
+        'symbol': current_symbol(),
         'app_name': 'Fyers Dom Analyzer'
     }
 
+@app.route('/api/metrics')
+def get_metrics():
+    """Feed health, end-to-end latency and pipeline counters"""
+    metrics = {
+        'feed': feed.status(),
+        'latency': latency.stats(),
+        'overload': overload.status(),
+    }
+    if decode_pool:
+        metrics['decode_pool'] = decode_pool.stats()
+    if alert_engine:
+        metrics['alerts'] = alert_engine.status()
+    if feed_manager:
+        metrics['user_feeds'] = feed_manager.status()
+    return metrics
+
+@app.route('/api/history')
+def get_history():
+    """Bucketed imbalance, spread and microprice history for charts.
+
+    Query: symbol (default: current), resolution (1s, 10s, 1m), since (epoch
+    seconds, inclusive - for incremental polling) and limit (newest N buckets).
+    """
+    symbol = request.args.get('symbol', SYMBOL)
+    resolution = request.args.get('resolution', '1s')
+    if resolution not in RESOLUTIONS:
+        return {'error': f"Invalid resolution; expected one of {', '.join(RESOLUTIONS)}"}, 400
+    result = history.query(symbol, resolution,
+                           since=request.args.get('since', type=float),
+                           limit=request.args.get('limit', type=int))
+    if result is None:
+        return {'error': f'No history for {symbol}'}, 404
+    return result
+
+def number_arg(data, name, default, low, high):
+    """(value, None) for an optional numeric JSON field within [low, high], else (None, error message)"""
+    value = data.get(name, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not low <= value <= high:
+        return None, f"{name} must be a number between {low:g} and {high:g}"
+    return float(value), None
+
+@app.route('/api/profile', methods=['GET', 'POST', 'DELETE'])
+def profile_capture():
+    """GET: capture status and last result; POST: start a capture; DELETE: stop it early.
+
+    POST body (all optional): seconds, interval_ms, allocations (bool),
+    thread ('feed' by default, '' for all threads).
+    """
+    if not PROFILING:
+        return {'error': 'Profiling is disabled; set PROFILING=1'}, 404
+    if not session.get('logged_in'):
+        return {'error': 'Unauthorized'}, 401
+
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        seconds, error = number_arg(data, 'seconds', PROFILE_SECONDS, 0.1, PROFILE_MAX_SECONDS)
+        if error:
+            return {'error': error}, 400
+        interval_ms, error = number_arg(data, 'interval_ms', PROFILE_INTERVAL_MS, 1, 1000)
+        if error:
+            return {'error': error}, 400
+        thread_name = data.get('thread', FEED_THREAD_NAME)
+        if thread_name is not None and not isinstance(thread_name, str):
+            return {'error': 'thread must be a thread name'}, 400
+        started = profiler.start(
+            seconds=seconds,
+            interval_ms=interval_ms,
+            thread_name=thread_name,
+            allocations=bool(data.get('allocations', False)),
+        )
+        if not started:
+            return {'error': 'A capture is already running'}, 409
+        return {'running': True}, 202
+    if request.method == 'DELETE':
+        profiler.stop()
+    return profiler.status()
+
+@app.route('/api/profile/collapsed')
+def profile_collapsed():
+    """Last capture as collapsed stacks, for flamegraph.pl / speedscope"""
+    if not PROFILING:
+        return {'error': 'Profiling is disabled; set PROFILING=1'}, 404
+    if not session.get('logged_in'):
+        return {'error': 'Unauthorized'}, 401
+    return profiler.collapsed, 200, {'Content-Type': 'text/plain; charset=utf-8'}
+
+@app.route('/api/option_chain')
+def get_option_chain():
+    """Current option-chain table (columnar, indexed by strike)"""
+    if not option_chain:
+        return {'error': 'Option-chain mode is not configured'}, 404
+    return option_chain.snapshot()
+
+@app.route('/api/synthetics')
+def get_synthetics():
+    """Current quotes of every synthetic defined in SYNTHETICS"""
+    if not synthetics:
+        return {'error': 'No synthetics configured'}, 404
+    return {'synthetics': synthetics.snapshot(), 'recomputes': synthetics.recomputes}
+
 @app.route('/api/symbol', methods=['POST'])
 def set_symbol():
     """Update the subscribed trading symbol"""
@@ -645,12 +642,21 @@ def set_symbol():
     if not new_symbol:
         return {'error': 'Invalid symbol'}, 400
 
+    if feed_manager:
+        # Only this user's feed changes; the owning instance resubscribes
+        feed_manager.set_symbols(session_auth_name(), [new_symbol.strip()] + WATCHLIST)
+        return {'symbol': new_symbol.strip()}
+
     global SYMBOL
     SYMBOL = new_symbol.strip()
+    feed.replace_subscriptions(feed_symbols())
 
-    # Subscribe to the new symbol on the WebSocket thread
-    if ws_loop:
-        asyncio.run_coroutine_threadsafe(subscribe_symbols(), ws_loop)
+    if FEED_CONNECTIONS > 1:
+        # Shards are re-planned with the new symbol set
+        sharded_feed.restart_pending = True
+    elif ws_loop:
+        # Subscribe to the new symbol on the WebSocket thread
+        asyncio.run_coroutine_threadsafe(subscribe_symbols([SYMBOL]), ws_loop)
 
     return {'symbol': SYMBOL}
 
@@ -658,17 +664,73 @@ def set_symbol():
 def handle_connect():
     print('Client connected')
     socketio.emit('test_message', {'message': 'Hello from backend!'})
+    if feed_manager:
+        connect_user_feed()
+        return
+    # Bring the new client up to date with feed health and the last known book
+    socketio.emit('feed_status', feed.status(), to=request.sid)
+    socketio.emit('overload', overload.status(), to=request.sid)
+    if last_market_data:
+        socketio.emit('market_depth', {
+            ticker: dict(depth, stale=feed.stale) for ticker, depth in last_market_data.items()
+        }, to=request.sid)
+    if option_chain:
+        socketio.emit('option_chain', option_chain.snapshot(), to=request.sid)
+    if synthetics:
+        socketio.emit('synthetics', synthetics.snapshot(), to=request.sid)
+
+def connect_user_feed():
+    """Per-user mode: join the user's room and catch up from their feed, if it runs here"""
+    name = session_auth_name()
+    if not session.get('logged_in') or not name:
+        return
+    join_room(user_room(name))
+    user_feed = feed_manager.feed(name)
+    if user_feed:
+        socketio.emit('feed_status', user_feed.manager.status(), to=request.sid)
+        snapshot = user_feed.snapshot()
+        if snapshot:
+            socketio.emit('market_depth', snapshot, to=request.sid)
+
+def run_user_feeds():
+    """Run every user's feed as a task on one event loop"""
+    threading.current_thread().name = FEED_THREAD_NAME
+    ensure_db()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(feed_manager.run())
+
+def flush_conflated():
+    """Publish conflated symbols whose interval is up; covers a feed that has gone quiet"""
+    if overload.pending:
+        publish_market_data(None)
+
+async def conflation_timer():
+    while True:
+        await asyncio.sleep(overload.emit_interval)
+        flush_conflated()
 
 def run_websocket():
     """Start the WebSocket client on its own event loop"""
-    global ws_loop
+    global ws_loop, decode_pool
+    threading.current_thread().name = FEED_THREAD_NAME
+    ensure_db()
+    start_checkpointing()
     ws_loop = asyncio.new_event_loop()
     asyncio.set_event_loop(ws_loop)
+    if DECODE_WORKERS > 0:
+        decode_pool = DecodePool(apply_decoded_frame, ws_loop)
+    ws_loop.create_task(conflation_timer())
     ws_loop.run_until_complete(websocket_client())
 
 if __name__ == '__main__':
-    import threading
-    ws_thread = threading.Thread(target=run_websocket)
+    if PROFILING:
+        install_signal_handler(profiler)
+    if feed_manager:
+        feed_target = run_user_feeds
+    else:
+        feed_target = run_sharded_feed if FEED_CONNECTIONS > 1 else run_websocket
+    ws_thread = threading.Thread(target=feed_target)
     ws_thread.daemon = True
     ws_thread.start()
     
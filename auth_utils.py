@@ -1,5 +1,6 @@
 import os
 import json
+import base64
 import hashlib
 from typing import Dict, Any, Tuple, Optional
 import requests
@@ -111,7 +112,20 @@ def authenticate_broker(request_token: str) -> Tuple[Optional[str], Optional[Dic
         response_data['message'] = error_msg
         return None, response_data
 
-def handle_auth_success(auth_token, username, broker='fyers'):
+def broker_user_id(access_token):
+    """Fyers client id (fy_id) from the access token's JWT payload, or None.
+
+    Only used to name the account's Auth row; the token itself is verified by
+    Fyers when the feed connects.
+    """
+    try:
+        payload = access_token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload)).get('fy_id')
+    except Exception:
+        return None
+
+def handle_auth_success(auth_token, username, broker='fyers', user_id=None):
     """Handle successful authentication by storing token in database"""
     try:
         # Get API credentials from environment
@@ -123,6 +137,7 @@ def handle_auth_success(auth_token, username, broker='fyers'):
             name=username, 
             auth_token=auth_token, 
             broker=broker,
+            user_id=user_id,
             api_key=api_key,
             api_secret=api_secret
         )
@@ -0,0 +1,221 @@
+"""End-to-end benchmark: frame injection to Socket.IO receipt.
+
+Runs three things in one process:
+  - the mock TBT feed (mock_feed_server.py) as the frame source,
+  - the real app feed path (websocket_client -> decode -> books ->
+    publish_market_data -> Socket.IO) served on a local port,
+  - N headless python-socketio clients that timestamp every market_depth
+    payload they receive.
+
+Latency is measured per payload, from the mock's send_time (stamped when
+the frame is built) to receipt by the client. Everything shares one clock,
+so no offset correction is needed, but send_time has 1 ms resolution. The
+script steps through every combination of client count and frame rate,
+and prints throughput and p50/p99/p99.9 latency for each step.
+
+Usage:
+    python bench_e2e.py --clients 1,10,50 --rates 200,1000,5000 --symbols 20 --batch 2
+    python bench_e2e.py --clients 10 --rates 2000 --duration 30 --json results.json
+
+App settings that affect the publish path (DECODE_WORKERS, OVERLOAD_*, and
+so on) are read from the environment as usual. Client transports come from
+python-socketio: install websocket-client for WebSocket transport,
+otherwise the clients fall back to long polling. The transport used is
+reported.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import threading
+
+LOGIN_TOKEN = 'bench:token'
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+class BenchClient:
+    """Headless dashboard: one Socket.IO connection timestamping market_depth payloads"""
+
+    def __init__(self, url):
+        import socketio
+        self.sio = socketio.Client(reconnection=False)
+        self.sio.on('market_depth', self.on_depth)
+        self.url = url
+        self.recording = False
+        self.latencies_ms = []
+        self.events = 0
+
+    def connect(self, attempts=20):
+        for attempt in range(attempts):
+            try:
+                self.sio.connect(self.url)
+                return
+            except Exception:
+                if attempt == attempts - 1:
+                    raise
+                time.sleep(0.5)
+
+    def on_depth(self, data):
+        received = time.time()
+        if not self.recording:
+            return
+        self.events += 1
+        for payload in data.values():
+            send_time = payload.get('send_time')
+            if send_time and not payload.get('stale'):
+                self.latencies_ms.append(received * 1000 - send_time)
+
+    def reset(self, recording):
+        self.latencies_ms = []
+        self.events = 0
+        self.recording = recording
+
+    def transport(self):
+        return self.sio.transport()
+
+    def disconnect(self):
+        try:
+            self.sio.disconnect()
+        except Exception:
+            pass
+
+def start_mock_feed(port, symbols, batch, rate):
+    """Mock feed on its own event loop thread; returns the server (its args can be re-rated live)"""
+    import mock_feed_server
+    args = mock_feed_server.parse_args(['--port', str(port), '--symbols', str(symbols),
+                                        '--batch', str(batch), '--rate', str(rate)])
+    server = mock_feed_server.MockFeedServer(args)
+    for i in range(symbols):
+        server.book_for(f"NSE:MOCK{i}-EQ")
+    threading.Thread(target=lambda: asyncio.run(server.run()), name='mock-feed', daemon=True).start()
+    return server
+
+def start_app(feed_port, port):
+    """Import the app against the mock feed and run its feed thread and Socket.IO server.
+
+    Login and the database are skipped: the feed gets a fixed auth header,
+    which the mock accepts. Everything from websocket_client onwards is the
+    real code path.
+    """
+    os.environ['WEBSOCKET_URL'] = f"ws://127.0.0.1:{feed_port}"
+    import app as dom_app
+    dom_app.ensure_db = lambda: None
+    dom_app.get_feed_auth_header = lambda: LOGIN_TOKEN
+    threading.Thread(target=dom_app.run_websocket, daemon=True).start()
+    threading.Thread(
+        target=lambda: dom_app.socketio.run(dom_app.app, host='127.0.0.1', port=port, debug=False,
+                                            use_reloader=False, log_output=False, allow_unsafe_werkzeug=True),
+        name='socketio',
+        daemon=True
+    ).start()
+    return dom_app
+
+def wait_for(condition, timeout, what):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise RuntimeError(f"Timed out waiting for {what}")
+        time.sleep(0.1)
+
+def run_step(server, dom_app, clients, rate, warmup, duration):
+    server.args.rate = rate
+    time.sleep(warmup)
+    sent_before = server.frames_sent
+    for client in clients:
+        client.reset(recording=True)
+    started = time.time()
+    time.sleep(duration)
+    elapsed = time.time() - started
+    for client in clients:
+        client.recording = False
+    sent = server.frames_sent - sent_before
+    latencies = sorted(value for client in clients for value in client.latencies_ms)
+    events = sum(client.events for client in clients)
+    return {
+        'clients': len(clients),
+        'target_rate': rate,
+        'frames_per_s': round(sent / elapsed, 1),
+        'events_per_s': round(events / elapsed, 1),
+        'payloads_per_s_per_client': round(len(latencies) / elapsed / len(clients), 1),
+        'payloads': len(latencies),
+        'p50_ms': percentile(latencies, 0.50),
+        'p99_ms': percentile(latencies, 0.99),
+        'p999_ms': percentile(latencies, 0.999),
+        'max_ms': latencies[-1] if latencies else None,
+        'overload': dom_app.overload.status()['state'],
+    }
+
+def format_row(result):
+    def ms(value):
+        return f"{value:9.1f}" if value is not None else f"{'-':>9}"
+    return (f"{result['clients']:>7} {result['target_rate']:>9} {result['frames_per_s']:>10.0f} "
+            f"{result['payloads_per_s_per_client']:>12.0f} {ms(result['p50_ms'])} {ms(result['p99_ms'])} "
+            f"{ms(result['p999_ms'])} {ms(result['max_ms'])}  {result['overload']}")
+
+HEADER = (f"{'clients':>7} {'rate':>9} {'frames/s':>10} {'payloads/s/c':>12} {'p50 ms':>9} {'p99 ms':>9} "
+          f"{'p99.9 ms':>9} {'max ms':>9}  overload")
+
+def parse_list(text):
+    return sorted({int(float(part)) for part in text.split(',') if part.strip()})
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end feed -> Socket.IO latency benchmark")
+    parser.add_argument('--clients', default='1,10', help='comma separated client counts')
+    parser.add_argument('--rates', default='200,1000', help='comma separated injected frames per second')
+    parser.add_argument('--symbols', type=int, default=10, help='mock symbols streamed to the app')
+    parser.add_argument('--batch', type=int, default=1, help='symbols carried per frame')
+    parser.add_argument('--duration', type=float, default=10, help='measured seconds per step')
+    parser.add_argument('--warmup', type=float, default=2, help='unmeasured seconds after each rate change')
+    parser.add_argument('--feed-port', type=int, default=8766)
+    parser.add_argument('--port', type=int, default=5055, help='Socket.IO port of the app under test')
+    parser.add_argument('--json', metavar='PATH', help='also write the results as JSON')
+    parser.add_argument('-v', '--verbose', action='store_true', help='keep app and mock console output')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    client_counts = parse_list(args.clients)
+    rates = parse_list(args.rates)
+    out = sys.stdout
+    if not args.verbose:
+        # App and mock print per frame; that output would swamp the report
+        sys.stdout = open(os.devnull, 'w')
+
+    server = start_mock_feed(args.feed_port, args.symbols, args.batch, rates[0])
+    dom_app = start_app(args.feed_port, args.port)
+    wait_for(lambda: dom_app.feed.state == 'connected', 30, 'the app to connect to the mock feed')
+    print(f"[BENCH] Feed connected; {args.symbols} symbols, {args.batch} per frame", file=out)
+
+    clients = []
+    results = []
+    print(HEADER, file=out)
+    try:
+        for count in client_counts:
+            while len(clients) < count:
+                client = BenchClient(f"http://127.0.0.1:{args.port}")
+                client.connect()
+                clients.append(client)
+            for rate in rates:
+                result = run_step(server, dom_app, clients, rate, args.warmup, args.duration)
+                results.append(result)
+                print(format_row(result), file=out)
+        print(f"[BENCH] Client transport: {clients[0].transport()}", file=out)
+    finally:
+        for client in clients:
+            client.disconnect()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'symbols': args.symbols, 'batch': args.batch, 'duration': args.duration,
+                       'results': results}, f, indent=2)
+        print(f"[BENCH] Wrote {args.json}", file=out)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,232 @@
+# Periodic order book checkpoints plus a raw frame journal for fast warm restart.
+#
+# Layout in CHECKPOINT_DIR:
+#   checkpoint.bin        latest checkpoint (replaced atomically)
+#   journal-<gen>.bin     frames received since the checkpoint of generation <gen>
+#
+# A checkpoint of generation G covers every frame in journals older than G, so
+# recovery loads the checkpoint and replays journals G, G+1, ... in order.
+import os
+import json
+import glob
+import time
+import zlib
+import queue
+import struct
+import threading
+from array import array
+
+CHECKPOINT_DIR = os.getenv('CHECKPOINT_DIR', '').strip("'")  # empty = disabled
+CHECKPOINT_INTERVAL = float(os.getenv('CHECKPOINT_INTERVAL', '30'))
+
+MAGIC = b'FYCK'
+VERSION = 1
+LEVELS = 50
+_RECORD = struct.Struct('<dI')  # receive time, frame length
+
+def capture_books(books):
+    """Copy the books into flat arrays (cheap enough for the feed thread)"""
+    tickers = []
+    prices = array('d')
+    qtys = array('Q')
+    orders = array('Q')
+    for ticker, book in books.items():
+        tickers.append({
+            'ticker': ticker,
+            'tbq': book['tbq'],
+            'tsq': book['tsq'],
+            'timestamp': book['timestamp'],
+            'initialized': book.get('initialized', False),
+        })
+        for side in ('bids', 'asks'):
+            levels = book[side]
+            for i in range(LEVELS):
+                level = levels[i]
+                prices.append(level['price'])
+                qtys.append(level['qty'])
+                orders.append(level['orders'])
+    return tickers, prices, qtys, orders
+
+def encode_checkpoint(captured, analytics_state, journal_gen):
+    """Serialize a captured state into the compact binary checkpoint format"""
+    tickers, prices, qtys, orders = captured
+    header = json.dumps({
+        'version': VERSION,
+        'created': time.time(),
+        'journal_gen': journal_gen,
+        'tickers': tickers,
+        'analytics': analytics_state,
+    }).encode()
+    body = zlib.compress(prices.tobytes() + qtys.tobytes() + orders.tobytes(), 1)
+    return MAGIC + struct.pack('<II', len(header), len(body)) + header + body
+
+def decode_checkpoint(blob):
+    """Parse a checkpoint blob into (header, books)"""
+    if blob[:4] != MAGIC:
+        raise ValueError("Not a checkpoint file")
+    header_len, body_len = struct.unpack_from('<II', blob, 4)
+    start = 12
+    header = json.loads(blob[start:start + header_len])
+    body = zlib.decompress(blob[start + header_len:start + header_len + body_len])
+
+    count = len(header['tickers']) * 2 * LEVELS
+    prices = array('d')
+    qtys = array('Q')
+    orders = array('Q')
+    prices.frombytes(body[:count * prices.itemsize])
+    offset = count * prices.itemsize
+    qtys.frombytes(body[offset:offset + count * qtys.itemsize])
+    offset += count * qtys.itemsize
+    orders.frombytes(body[offset:offset + count * orders.itemsize])
+
+    books = {}
+    index = 0
+    for meta in header['tickers']:
+        book = {
+            'tbq': meta['tbq'],
+            'tsq': meta['tsq'],
+            'timestamp': meta['timestamp'],
+            'initialized': meta['initialized'],
+        }
+        for side in ('bids', 'asks'):
+            book[side] = {}
+            for i in range(LEVELS):
+                book[side][i] = {'price': prices[index], 'qty': qtys[index], 'orders': orders[index], 'level': i}
+                index += 1
+        books[meta['ticker']] = book
+    return header, books
+
+def _journal_path(directory, gen):
+    return os.path.join(directory, f'journal-{gen:08d}.bin')
+
+def _journal_gens(directory):
+    gens = []
+    for path in glob.glob(os.path.join(directory, 'journal-*.bin')):
+        try:
+            gens.append(int(os.path.basename(path)[8:16]))
+        except ValueError:
+            continue
+    return sorted(gens)
+
+def read_journal(path):
+    """Yield raw frames from a journal file, stopping at a torn trailing record"""
+    with open(path, 'rb') as f:
+        while True:
+            head = f.read(_RECORD.size)
+            if len(head) < _RECORD.size:
+                return
+            _, length = _RECORD.unpack(head)
+            frame = f.read(length)
+            if len(frame) < length:
+                return
+            yield frame
+
+class Checkpointer:
+    """Journals raw frames and periodically writes checkpoints on a background thread"""
+
+    def __init__(self, directory=CHECKPOINT_DIR, interval=CHECKPOINT_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self.journal = None
+        self.journal_gen = 0
+        self.next_checkpoint = time.time() + interval
+        self.last_checkpoint = None
+        self.next_flush = 0.0
+        self.writes = queue.Queue(maxsize=1)
+        os.makedirs(directory, exist_ok=True)
+        gens = _journal_gens(directory)
+        self._open_journal(gens[-1] + 1 if gens else 1)
+        threading.Thread(target=self._writer, name='checkpoint-writer', daemon=True).start()
+
+    @property
+    def checkpoint_path(self):
+        return os.path.join(self.directory, 'checkpoint.bin')
+
+    def _open_journal(self, gen):
+        if self.journal:
+            self.journal.close()
+        self.journal_gen = gen
+        self.journal = open(_journal_path(self.directory, gen), 'ab', buffering=1024 * 1024)
+
+    def record(self, message_bytes):
+        """Append a raw frame to the current journal (flushed about once a second)"""
+        now = time.time()
+        self.journal.write(_RECORD.pack(now, len(message_bytes)))
+        self.journal.write(message_bytes)
+        if now >= self.next_flush:
+            self.journal.flush()
+            self.next_flush = now + 1.0
+
+    def due(self):
+        return time.time() >= self.next_checkpoint
+
+    def begin(self):
+        """Start a checkpoint: rotate the journal and return the new generation (None to skip).
+
+        Every frame journaled before this call must be applied to the books
+        before commit() captures them; frames after it go to the new journal.
+        """
+        self.next_checkpoint = time.time() + self.interval
+        if self.writes.full():
+            print("[CHECKPOINT] Previous checkpoint still writing, skipping")
+            return None
+        self._open_journal(self.journal_gen + 1)
+        return self.journal_gen
+
+    def commit(self, books, analytics_state, gen):
+        """Capture state now and hand serialization + IO to the writer thread.
+
+        Must be called from the thread that applies frames, once exactly the
+        frames journaled before begin() have been applied to `books`.
+        """
+        if self.writes.full():
+            print("[CHECKPOINT] Previous checkpoint still writing, skipping")
+            return
+        self.writes.put((capture_books(books), analytics_state, gen))
+
+    def checkpoint(self, books, analytics_state):
+        """begin() + commit() for callers that apply frames synchronously"""
+        gen = self.begin()
+        if gen is not None:
+            self.commit(books, analytics_state, gen)
+
+    def _writer(self):
+        while True:
+            captured, analytics_state, gen = self.writes.get()
+            try:
+                blob = encode_checkpoint(captured, analytics_state, gen)
+                tmp_path = self.checkpoint_path + '.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(blob)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.checkpoint_path)
+                self.last_checkpoint = time.time()
+                # Everything before this generation is now covered by the checkpoint
+                for old_gen in _journal_gens(self.directory):
+                    if old_gen < gen:
+                        os.remove(_journal_path(self.directory, old_gen))
+                print(f"[CHECKPOINT] Wrote {len(captured[0])} books ({len(blob):,} bytes), journal gen {gen}")
+            except Exception as e:
+                print(f"[CHECKPOINT] Error writing checkpoint: {e}")
+
+    def load(self):
+        """Return (books, analytics_state, frames) to restore, or None if no checkpoint exists.
+
+        `frames` iterates the journaled frames received after the checkpoint,
+        in order; the current (empty) journal is excluded.
+        """
+        header, books, analytics_state = {'journal_gen': 0}, {}, None
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, 'rb') as f:
+                header, books = decode_checkpoint(f.read())
+            analytics_state = header.get('analytics')
+        gens = [g for g in _journal_gens(self.directory) if header['journal_gen'] <= g < self.journal_gen]
+        if not books and not gens:
+            return None
+
+        def frames():
+            for gen in gens:
+                yield from read_journal(_journal_path(self.directory, gen))
+
+        return books, analytics_state, frames()
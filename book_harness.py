@@ -0,0 +1,440 @@
+"""Deterministic correctness harness for the order book engine.
+
+Generates seeded random sequences of snapshot and incremental SocketMessage
+depth frames, applies them to a small reference model and to every book
+implementation in the tree, and checks that all of them expose the same
+books after every frame. Earlier payloads are re-checked after later
+frames, since a payload must not change once it has been handed out. Any
+failure is reported with the seed and frame count that reproduce it.
+
+Implementations compared:
+    full_book   update_order_book + get_full_order_book (dict updates)
+    view        apply_market_depth + get_book_view / build_depth_payload
+    columnar    decode_market_depth_columns applied as arrays (decode pool path)
+    wire        BookEngine.process on the raw frame bytes
+
+Usage:
+    python book_harness.py --cases 500 --messages 200
+    python book_harness.py --seed 1234 --cases 1 --messages 57 -v
+    python book_harness.py --replay checkpoints/          # recorded journals
+    python book_harness.py --replay journal-00000003.bin
+"""
+import os
+import sys
+import glob
+import random
+import argparse
+from collections import deque
+
+import msg_pb2
+from book_checkpoint import read_journal
+from feed_decoder import decode_market_depth, decode_market_depth_columns
+from feed_engine import BookEngine
+import order_book
+from order_book import (
+    update_order_book,
+    get_full_order_book,
+    get_book_view,
+    apply_market_depth,
+    build_depth_payload,
+    calculate_order_book_imbalance,
+)
+
+LEVELS = 50
+# Payloads kept per engine and re-checked after later frames
+KEPT_PAYLOADS = 32
+EMPTY = (0.0, 0, 0)
+
+def apply_level(old, price, qty, orders):
+    """Reference rule for one level update; levels are (price, qty, orders)"""
+    if qty == 0:
+        if price > 0:
+            return (price, 0, orders)
+        if old[0] != 0.0:
+            # A removal without a valid price keeps whatever price the level had
+            return (old[0], 0, orders)
+        return EMPTY
+    if price == 0.0:
+        # Quantity without a price only corrects an existing level
+        return (old[0], qty, orders) if old[0] > 0 else old
+    return (price, qty, orders)
+
+def sorted_side(levels, reverse):
+    return sorted((level for level in levels if level[0] > 0), key=lambda x: x[0], reverse=reverse)
+
+class ReferenceBooks:
+    """Plain restatement of the book rules, written for clarity rather than speed"""
+
+    name = 'reference'
+
+    def __init__(self):
+        self.books = {}
+
+    def apply(self, updates, frame):
+        for update in updates:
+            book = self.books.setdefault(update['ticker'], {
+                'bids': [EMPTY] * LEVELS,
+                'asks': [EMPTY] * LEVELS,
+            })
+            book['tbq'] = update['tbq']
+            book['tsq'] = update['tsq']
+            book['timestamp'] = update['timestamp']
+            for side in ('bids', 'asks'):
+                levels = book[side]
+                for entry in update[side]:
+                    if 0 <= entry['level'] < LEVELS:
+                        levels[entry['level']] = apply_level(
+                            levels[entry['level']], entry['price'], entry['qty'], entry['orders'])
+
+    def view(self, ticker):
+        book = self.books.get(ticker)
+        if book is None:
+            return None
+        return {
+            'tbq': book['tbq'],
+            'tsq': book['tsq'],
+            'timestamp': book['timestamp'],
+            'bids': sorted_side(book['bids'], True),
+            'asks': sorted_side(book['asks'], False),
+        }
+
+    def raw(self, ticker):
+        book = self.books.get(ticker)
+        return (book['bids'], book['asks']) if book else None
+
+def _raw_levels(book):
+    return tuple(
+        [(book[side][i]['price'], book[side][i]['qty'], book[side][i]['orders']) for i in range(LEVELS)]
+        for side in ('bids', 'asks')
+    )
+
+def keep_payload(kept, payload):
+    """Remember a payload with a copy of what it said when it was built"""
+    kept.append((payload, _payload_view(payload)))
+
+def check_kept(kept):
+    """Earlier payloads must not change when later frames update the book"""
+    for payload, original in kept:
+        assert _payload_view(payload) == original, "a payload from an earlier frame changed after a later update"
+        check_payload(payload)
+
+def _payload_view(payload):
+    return {
+        'tbq': payload['total_bid_qty'],
+        'tsq': payload['total_sell_qty'],
+        'timestamp': payload['timestamp'] / 1000,
+        'bids': [(row['price'], row['quantity'], row['orders']) for row in payload['bids']],
+        'asks': [(row['price'], row['quantity'], row['orders']) for row in payload['asks']],
+    }
+
+class FullBookEngine:
+    name = 'full_book'
+
+    def __init__(self):
+        self.books = {}
+
+    def apply(self, updates, frame):
+        for update in updates:
+            update_order_book(update['ticker'], update['bids'], update['asks'], update['tbq'],
+                              update['tsq'], update['timestamp'], update['is_snapshot'], self.books)
+
+    def view(self, ticker):
+        full = get_full_order_book(ticker, self.books)
+        if full is None:
+            return None
+        return {
+            'tbq': full['tbq'],
+            'tsq': full['tsq'],
+            'timestamp': full['timestamp'],
+            'bids': [(b['price'], b['qty'], b['orders']) for b in full['bids']],
+            'asks': [(a['price'], a['qty'], a['orders']) for a in full['asks']],
+        }
+
+    def raw(self, ticker):
+        return _raw_levels(self.books[ticker]) if ticker in self.books else None
+
+class ViewEngine(FullBookEngine):
+    name = 'view'
+
+    def __init__(self):
+        super().__init__()
+        self.kept = deque(maxlen=KEPT_PAYLOADS)
+
+    def apply(self, updates, frame):
+        apply_market_depth(updates, self.books)
+
+    def view(self, ticker):
+        view = get_book_view(ticker, self.books)
+        if view is None:
+            return None
+        book = self.books[ticker]
+        payload = build_depth_payload(ticker, self.books)
+        check_kept(self.kept)
+        keep_payload(self.kept, payload)
+        # Arrays, rows and the payload must all agree with each other
+        assert view['bids'] is payload['bids'], "payload copied the view instead of sharing it"
+        assert list(zip(view['bidprice'], view['bidqty'], view['bidordn'])) == \
+            [(r['price'], r['quantity'], r['orders']) for r in view['bids']], "bid arrays disagree with rows"
+        assert list(zip(view['askprice'], view['askqty'], view['askordn'])) == \
+            [(r['price'], r['quantity'], r['orders']) for r in view['asks']], "ask arrays disagree with rows"
+        return {
+            'tbq': book['tbq'],
+            'tsq': book['tsq'],
+            'timestamp': book['timestamp'],
+            'bids': list(zip(view['bidprice'], view['bidqty'], view['bidordn'])),
+            'asks': list(zip(view['askprice'], view['askqty'], view['askordn'])),
+        }
+
+class WireEngine:
+    name = 'wire'
+
+    def __init__(self):
+        self.engine = BookEngine()
+        self.payloads = {}
+        self.kept = deque(maxlen=KEPT_PAYLOADS)
+
+    def events(self, frame):
+        return self.engine.process(frame)
+
+    def apply(self, updates, frame):
+        for event in self.events(frame):
+            if event['type'] == 'book':
+                self.payloads[event['ticker']] = event['book']
+                keep_payload(self.kept, event['book'])
+            elif event['type'] == 'error':
+                raise AssertionError(f"engine rejected frame: {event['message']}")
+
+    def view(self, ticker):
+        payload = self.payloads.get(ticker)
+        if payload is None:
+            return None
+        check_payload(payload)
+        check_kept(self.kept)
+        return _payload_view(payload)
+
+    def raw(self, ticker):
+        return _raw_levels(self.engine.books[ticker]) if ticker in self.engine.books else None
+
+class ColumnarEngine(WireEngine):
+    name = 'columnar'
+
+    def events(self, frame):
+        updates = decode_market_depth_columns(frame)
+        return self.engine.apply(updates)
+
+def check_payload(payload):
+    """Derived payload fields must match a from-scratch computation over its own rows"""
+    bids = [{'price': r['price'], 'qty': r['quantity'], 'orders': r['orders'], 'level': r['level']}
+            for r in payload['bids']]
+    asks = [{'price': r['price'], 'qty': r['quantity'], 'orders': r['orders'], 'level': r['level']}
+            for r in payload['asks']]
+    assert [b['level'] for b in bids] == list(range(len(bids))), "bid rows not numbered from 0"
+    assert [a['level'] for a in asks] == list(range(len(asks))), "ask rows not numbered from 0"
+    for depth in (10, 20, 50):
+        expected = calculate_order_book_imbalance(bids, asks, depth)
+        assert payload[f'imbalance_{depth}'] == expected, f"imbalance_{depth} differs: {payload[f'imbalance_{depth}']} != {expected}"
+    if bids:
+        largest = max(bids, key=lambda x: x['qty'])
+        assert payload['largest_bid'] == largest, f"largest_bid differs: {payload['largest_bid']} != {largest}"
+
+def make_engines():
+    return [ReferenceBooks(), FullBookEngine(), ViewEngine(), ColumnarEngine(), WireEngine()]
+
+def compare(engines, tickers):
+    """Return a description of the first disagreement with the reference, or None"""
+    reference = engines[0]
+    for ticker in tickers:
+        expected = reference.view(ticker)
+        expected_raw = reference.raw(ticker)
+        for engine in engines[1:]:
+            try:
+                actual = engine.view(ticker)
+            except AssertionError as e:
+                return f"{engine.name} {ticker}: {e}"
+            if actual != expected:
+                return f"{engine.name} {ticker}: {describe_difference(expected, actual)}"
+            raw = engine.raw(ticker)
+            if raw is not None and tuple(raw) != tuple(expected_raw):
+                for side, (want, got) in zip(('bids', 'asks'), zip(expected_raw, raw)):
+                    for i, (w, g) in enumerate(zip(want, got)):
+                        if w != g:
+                            return f"{engine.name} {ticker}: raw {side}[{i}] is {g}, reference has {w}"
+    return None
+
+def describe_difference(expected, actual):
+    if expected is None or actual is None:
+        return f"book presence differs (reference={expected is not None}, engine={actual is not None})"
+    for key in ('tbq', 'tsq', 'timestamp'):
+        if expected[key] != actual[key]:
+            return f"{key} is {actual[key]}, reference has {expected[key]}"
+    for side in ('bids', 'asks'):
+        want, got = expected[side], actual[side]
+        for i in range(max(len(want), len(got))):
+            w = want[i] if i < len(want) else None
+            g = got[i] if i < len(got) else None
+            if w != g:
+                return f"{side} row {i} is {g}, reference has {w} ({len(got)} vs {len(want)} rows)"
+    return "views differ"
+
+class FrameGenerator:
+    """Seeded source of adversarial depth frames for a few tickers"""
+
+    def __init__(self, seed, tickers=2, tick=5, lot=75):
+        self.rng = random.Random(seed)
+        self.tick = tick
+        self.lot = lot
+        self.tickers = [f"NSE:HARNESS{i}-EQ" for i in range(tickers)]
+        self.mids = {ticker: self.rng.randint(2000000, 2600000) // tick * tick for ticker in self.tickers}
+        self.time = 1700000000
+        self.first = True
+
+    def price(self, ticker, side, level):
+        """Price in paise: mostly the ladder, sometimes zero, negative, off-ladder or a tie"""
+        rng = self.rng
+        roll = rng.random()
+        if roll < 0.10:
+            return 0
+        if roll < 0.12:
+            return -self.tick
+        if roll < 0.20:
+            return self.mids[ticker] + rng.randint(-60, 60) * self.tick
+        offset = (level + 1) * self.tick
+        if roll < 0.25:
+            offset = level * self.tick  # collides with the neighbouring level
+        return self.mids[ticker] - offset if side == 'bids' else self.mids[ticker] + offset
+
+    def level_entry(self, ticker, side, level):
+        rng = self.rng
+        qty = 0 if rng.random() < 0.15 else rng.randint(1, 40) * self.lot
+        orders = rng.randint(0, 20) if qty or rng.random() < 0.5 else 0
+        return {'price': self.price(ticker, side, level), 'qty': qty, 'orders': orders, 'level': level}
+
+    def next_message(self):
+        """Return (updates, frame bytes); updates mirror the frame with decoded prices"""
+        rng = self.rng
+        snapshot = rng.random() < (0.5 if self.first else 0.05)
+        self.first = False
+        self.time += rng.randint(0, 2)
+        message = msg_pb2.SocketMessage()
+        message.type = msg_pb2.depth
+        message.snapshot = snapshot
+        updates = []
+        for ticker in rng.sample(self.tickers, rng.randint(1, len(self.tickers))):
+            if rng.random() < 0.05:
+                self.mids[ticker] += rng.choice((-1, 1)) * self.tick
+            sides = {}
+            for side in ('bids', 'asks'):
+                if snapshot:
+                    levels = list(range(LEVELS))
+                else:
+                    # Duplicates and out-of-range levels are deliberate
+                    levels = [min(int(rng.expovariate(0.1)), LEVELS + 5) for _ in range(rng.randint(0, 8))]
+                sides[side] = [self.level_entry(ticker, side, level) for level in levels]
+            feed = message.feeds[ticker]
+            feed.ticker = ticker
+            feed.snapshot = snapshot
+            feed.feed_time.value = self.time
+            feed.depth.tbq.value = rng.randint(0, 10 ** 7)
+            feed.depth.tsq.value = rng.randint(0, 10 ** 7)
+            for side, entries in sides.items():
+                for entry in entries:
+                    level = getattr(feed.depth, side).add()
+                    level.price.value = entry['price']
+                    level.qty.value = entry['qty']
+                    level.nord.value = entry['orders']
+                    level.num.value = entry['level']
+                    entry['price'] = entry['price'] / 100.0
+            updates.append({
+                'ticker': ticker,
+                'timestamp': self.time,
+                'tbq': feed.depth.tbq.value,
+                'tsq': feed.depth.tsq.value,
+                'is_snapshot': snapshot,
+                'bids': sides['bids'],
+                'asks': sides['asks'],
+            })
+        return updates, message.SerializeToString()
+
+def run_case(seed, messages, tickers, verbose=False):
+    """Run one seeded sequence; return None or (frame index, failure description)"""
+    generator = FrameGenerator(seed, tickers)
+    engines = make_engines()
+    seen = set()
+    for index in range(messages):
+        updates, frame = generator.next_message()
+        seen.update(update['ticker'] for update in updates)
+        for engine in engines:
+            # Engines that store update dicts get their own copy
+            engine.apply([dict(u, bids=[dict(b) for b in u['bids']], asks=[dict(a) for a in u['asks']])
+                          for u in updates], frame)
+        failure = compare(engines, sorted(seen))
+        if verbose:
+            kinds = 'snapshot' if updates[0]['is_snapshot'] else 'incremental'
+            print(f"[HARNESS] seed {seed} frame {index}: {kinds} for {len(updates)} tickers -> {failure or 'ok'}")
+        if failure:
+            return index, failure
+    return None
+
+def journal_paths(paths):
+    """Expand checkpoint directories into their journals, oldest generation first"""
+    expanded = []
+    for path in paths:
+        if os.path.isdir(path):
+            expanded.extend(sorted(glob.glob(os.path.join(path, 'journal-*.bin'))))
+        else:
+            expanded.append(path)
+    return expanded
+
+def run_replay(paths, verbose=False):
+    """Differential mode: replay recorded frames through every engine; return exit status"""
+    engines = make_engines()
+    seen = set()
+    frames = 0
+    for path in journal_paths(paths):
+        print(f"[HARNESS] Replaying {path}")
+        for frame in read_journal(path):
+            updates = decode_market_depth(frame)
+            if not updates:
+                continue
+            seen.update(update['ticker'] for update in updates)
+            for engine in engines:
+                engine.apply([dict(u, bids=[dict(b) for b in u['bids']], asks=[dict(a) for a in u['asks']])
+                              for u in updates], frame)
+            frames += 1
+            failure = compare(engines, [update['ticker'] for update in updates])
+            if failure:
+                print(f"[HARNESS] FAIL at frame {frames} of {path}: {failure}")
+                return 1
+            if verbose and frames % 10000 == 0:
+                print(f"[HARNESS] {frames} frames, {len(seen)} tickers agree")
+    print(f"[HARNESS] Replayed {frames} frames over {len(seen)} tickers: all engines agree")
+    return 0
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Order book correctness harness")
+    parser.add_argument('--cases', type=int, default=200, help='number of seeded sequences')
+    parser.add_argument('--messages', type=int, default=300, help='frames per sequence')
+    parser.add_argument('--tickers', type=int, default=2, help='tickers per sequence')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first case')
+    parser.add_argument('--replay', nargs='+', metavar='PATH',
+                        help='journal files or checkpoint directories to replay instead of generating frames')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    order_book.set_verbose(False)
+    if args.replay:
+        return run_replay(args.replay, args.verbose)
+    for seed in range(args.seed, args.seed + args.cases):
+        result = run_case(seed, args.messages, args.tickers, args.verbose)
+        if result:
+            index, failure = result
+            print(f"[HARNESS] FAIL seed {seed} at frame {index}: {failure}")
+            print(f"[HARNESS] Reproduce: python {sys.argv[0]} --seed {seed} --cases 1 --messages {index + 1} -v")
+            return 1
+    print(f"[HARNESS] {args.cases} cases x {args.messages} frames: all engines agree")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
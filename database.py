@@ -1,38 +1,111 @@
 import os
+import json
+import time
 import base64
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Boolean
+import hashlib
+import tempfile
+import threading
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Boolean, Index
 from sqlalchemy.orm import scoped_session, sessionmaker, declarative_base
 from sqlalchemy.sql import func
-from argon2 import PasswordHasher
-from argon2.exceptions import VerifyMismatchError
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from dotenv import load_dotenv
+from token_store import get_token_store
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Argon2 hasher
-ph = PasswordHasher()
-
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///fyers_auth.db')
 PEPPER = os.getenv('API_KEY_PEPPER', 'default-pepper-change-in-production')
+AUTH_CACHE_TTL = float(os.getenv('AUTH_CACHE_TTL', '300'))
+# Derived Fernet key is cached here (mode 0600) so restarts skip PBKDF2
+FERNET_KEY_FILE = os.getenv('FERNET_KEY_FILE', '.fernet.key').strip("'")
+KDF_SALT = b'fyers_static_salt'
+
+# In-process cache of decrypted auth lookups: key -> (expires_at, value).
+# Secrets are held only in this dict and never written anywhere else.
+_auth_cache = {}
+_auth_cache_lock = threading.Lock()
+_MISSING = object()
+
+# Argon2 hasher and Fernet cipher are created on first use; importing this
+# module does no crypto work
+_password_hasher = None
+_fernet = None
+_fernet_lock = threading.Lock()
+
+def get_password_hasher():
+    global _password_hasher
+    if _password_hasher is None:
+        from argon2 import PasswordHasher
+        _password_hasher = PasswordHasher()
+    return _password_hasher
+
+def _pepper_fingerprint():
+    """Identifies which pepper/salt a cached key file was derived from"""
+    return hashlib.sha256(KDF_SALT + PEPPER.encode()).hexdigest()[:16]
+
+def _load_key_file():
+    """Return the cached key if the file exists, is private and matches the pepper"""
+    if not FERNET_KEY_FILE or not os.path.exists(FERNET_KEY_FILE):
+        return None
+    try:
+        if os.name == 'posix' and os.stat(FERNET_KEY_FILE).st_mode & 0o077:
+            print(f"Ignoring {FERNET_KEY_FILE}: file is readable by other users")
+            return None
+        with open(FERNET_KEY_FILE) as f:
+            data = json.load(f)
+        if data.get('fingerprint') != _pepper_fingerprint():
+            return None
+        return data['key'].encode()
+    except Exception as e:
+        print(f"Ignoring unreadable key file {FERNET_KEY_FILE}: {e}")
+        return None
+
+def _save_key_file(key):
+    """Write the key to a fresh 0600 file and move it over the old one.
+
+    Opening the existing path would keep its mode, so a key file rejected as
+    readable by others would be rewritten just as exposed.
+    """
+    directory = os.path.dirname(os.path.abspath(FERNET_KEY_FILE))
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.fernet-', suffix='.tmp')  # created 0600
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'fingerprint': _pepper_fingerprint(), 'key': key.decode()}, f)
+        os.replace(tmp_path, FERNET_KEY_FILE)
+    except Exception as e:
+        print(f"Could not cache encryption key in {FERNET_KEY_FILE}: {e}")
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
 # Setup Fernet encryption for auth tokens
 def get_encryption_key():
-    """Generate a Fernet key from the pepper"""
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=b'fyers_static_salt',
-        iterations=100000,
-    )
-    key = base64.urlsafe_b64encode(kdf.derive(PEPPER.encode()))
+    """Generate a Fernet key from the pepper (reused from the protected key file when possible)"""
+    from cryptography.fernet import Fernet
+    key = _load_key_file()
+    if key is None:
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+        kdf = PBKDF2HMAC(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=KDF_SALT,
+            iterations=100000,
+        )
+        key = base64.urlsafe_b64encode(kdf.derive(PEPPER.encode()))
+        if FERNET_KEY_FILE:
+            _save_key_file(key)
     return Fernet(key)
 
-# Initialize Fernet cipher
-fernet = get_encryption_key()
+def get_fernet():
+    """Fernet cipher, derived once per process on first use"""
+    global _fernet
+    if _fernet is None:
+        with _fernet_lock:
+            if _fernet is None:
+                _fernet = get_encryption_key()
+    return _fernet
 
 engine = create_engine(
     DATABASE_URL,
@@ -57,13 +130,14 @@ class User(Base):
     def set_password(self, password):
         """Set password using Argon2 hashing"""
         peppered_password = password + PEPPER
-        self.password_hash = ph.hash(peppered_password)
+        self.password_hash = get_password_hasher().hash(peppered_password)
 
     def check_password(self, password):
         """Check password using Argon2 verification"""
         peppered_password = password + PEPPER
+        from argon2.exceptions import VerifyMismatchError
         try:
-            ph.verify(self.password_hash, peppered_password)
+            get_password_hasher().verify(self.password_hash, peppered_password)
             return True
         except VerifyMismatchError:
             return False
@@ -81,6 +155,27 @@ class Auth(Base):
     created_at = Column(DateTime(timezone=True), default=func.now())
     updated_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now())
 
+    __table_args__ = (
+        # Active-feed lookups (get_active_auth_names) and per broker-account lookups
+        Index('ix_auth_broker_revoked', 'broker', 'is_revoked'),
+        Index('ix_auth_user_broker', 'user_id', 'broker'),
+    )
+
+_db_ready = False
+_db_lock = threading.Lock()
+
+def ensure_db():
+    """Run init_db() once, on first use instead of at import time"""
+    global _db_ready
+    if _db_ready:
+        return
+    with _db_lock:
+        if not _db_ready:
+            init_db()
+            # Auth changes made by other instances arrive through the token store
+            get_token_store().subscribe(_on_token_message)
+            _db_ready = True
+
 def init_db():
     """Initialize database tables"""
     Base.metadata.create_all(bind=engine)
@@ -100,6 +195,13 @@ def init_db():
             except Exception as alter_error:
                 print(f"Error adding columns: {alter_error}")
     
+    # create_all skips tables that already exist, so add indexes introduced later
+    for index in Auth.__table__.indexes:
+        try:
+            index.create(bind=engine, checkfirst=True)
+        except Exception as e:
+            print(f"Error creating index {index.name}: {e}")
+    
     # Create default admin user if not exists
     admin_user = User.query.filter_by(username='admin').first()
     if not admin_user:
@@ -109,18 +211,46 @@ def init_db():
         db_session.commit()
         print("Created default admin user (username: admin, password: admin123)")
 
+def _cache_get(key):
+    """Return a cached value, or _MISSING if absent or expired"""
+    with _auth_cache_lock:
+        entry = _auth_cache.get(key)
+        if entry is None:
+            return _MISSING
+        if entry[0] < time.monotonic():
+            del _auth_cache[key]
+            return _MISSING
+        return entry[1]
+
+def _cache_put(key, value):
+    with _auth_cache_lock:
+        _auth_cache[key] = (time.monotonic() + AUTH_CACHE_TTL, value)
+
+def invalidate_auth_cache(name=None):
+    """Drop cached auth for one user (and the active-auth lookup), or everything"""
+    with _auth_cache_lock:
+        if name is None:
+            _auth_cache.clear()
+            return
+        for key in [k for k in _auth_cache if k[0] in ('active', 'active_all') or k[1] == name]:
+            del _auth_cache[key]
+
+def _on_token_message(message):
+    if message.get('type') == 'auth':
+        invalidate_auth_cache(message.get('name'))
+
 def encrypt_token(token):
     """Encrypt auth token"""
     if not token:
         return ''
-    return fernet.encrypt(token.encode()).decode()
+    return get_fernet().encrypt(token.encode()).decode()
 
 def decrypt_token(encrypted_token):
     """Decrypt auth token"""
     if not encrypted_token:
         return ''
     try:
-        return fernet.decrypt(encrypted_token.encode()).decode()
+        return get_fernet().decrypt(encrypted_token.encode()).decode()
     except Exception as e:
         print(f"Error decrypting token: {e}")
         return None
@@ -151,18 +281,15 @@ def upsert_auth(name, auth_token, broker='fyers', user_id=None, api_key=None, ap
         )
         db_session.add(auth_obj)
     db_session.commit()
+    invalidate_auth_cache(name)
+    # Other instances drop their cached copy and re-check which feeds should run
+    get_token_store().publish({'type': 'auth', 'name': name})
     return auth_obj.id
 
 def get_auth_token(name):
     """Get decrypted auth token"""
-    try:
-        auth_obj = Auth.query.filter_by(name=name).first()
-        if auth_obj and not auth_obj.is_revoked:
-            return decrypt_token(auth_obj.auth)
-        return None
-    except Exception as e:
-        print(f"Error while querying the database for auth token: {e}")
-        return None
+    auth_data = get_auth_data(name)
+    return auth_data['auth_token'] if auth_data else None
 
 def get_api_credentials(name):
     """Get decrypted API key and secret"""
@@ -178,22 +305,55 @@ def get_api_credentials(name):
         return None, None
 
 def get_auth_data(name):
-    """Get all auth data for a user"""
+    """Get all auth data for a user (cached for AUTH_CACHE_TTL seconds)"""
+    cached = _cache_get(('data', name))
+    if cached is not _MISSING:
+        return dict(cached) if cached else None
     try:
         auth_obj = Auth.query.filter_by(name=name).first()
         if auth_obj and not auth_obj.is_revoked:
-            return {
+            auth_data = {
                 'auth_token': decrypt_token(auth_obj.auth),
                 'api_key': decrypt_token(auth_obj.api_key) if auth_obj.api_key else None,
                 'api_secret': decrypt_token(auth_obj.api_secret) if auth_obj.api_secret else None,
                 'broker': auth_obj.broker,
                 'user_id': auth_obj.user_id
             }
-        return None
+        else:
+            auth_data = None
+        _cache_put(('data', name), auth_data)
+        return dict(auth_data) if auth_data else None
     except Exception as e:
         print(f"Error while querying the database for auth data: {e}")
         return None
 
+def get_active_auth_name(broker='fyers'):
+    """Get the name of the first non-revoked auth record for a broker (cached)"""
+    cached = _cache_get(('active', broker))
+    if cached is not _MISSING:
+        return cached
+    try:
+        auth_obj = Auth.query.filter_by(is_revoked=False, broker=broker).first()
+        name = auth_obj.name if auth_obj else None
+        _cache_put(('active', broker), name)
+        return name
+    except Exception as e:
+        print(f"Error while querying the database for active auth: {e}")
+        return None
+
+def get_active_auth_names(broker='fyers'):
+    """Names of every non-revoked auth record for a broker (cached); one feed runs per name"""
+    cached = _cache_get(('active_all', broker))
+    if cached is not _MISSING:
+        return list(cached)
+    try:
+        names = [name for (name,) in db_session.query(Auth.name).filter_by(is_revoked=False, broker=broker)]
+        _cache_put(('active_all', broker), names)
+        return list(names)
+    except Exception as e:
+        print(f"Error while querying the database for active auths: {e}")
+        return []
+
 def authenticate_user(username, password):
     """Authenticate user with username and password"""
     try:
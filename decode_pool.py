@@ -0,0 +1,136 @@
+# Optional pool of worker processes that parse protobuf frames off the feed thread.
+# Frames travel to workers through a shared-memory slot ring; results come back
+# as columnar arrays and are applied strictly in arrival order, on the feed
+# thread's event loop.
+import os
+import time
+import atexit
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from feed_decoder import decode_market_depth_columns
+
+DECODE_WORKERS = int(os.getenv('DECODE_WORKERS', '0'))  # 0 = decode inline on the feed thread
+DECODE_SLOTS = int(os.getenv('DECODE_SLOTS', '64'))
+DECODE_SLOT_BYTES = int(os.getenv('DECODE_SLOT_BYTES', str(256 * 1024)))
+
+# Worker-side handle to the parent's shared memory block
+_worker_shm = None
+
+def _init_worker(shm_name):
+    global _worker_shm
+    _worker_shm = shared_memory.SharedMemory(name=shm_name)
+
+def _decode_slot(offset, length, received):
+    """Worker task: parse the frame stored at [offset, offset + length)"""
+    return decode_market_depth_columns(bytes(_worker_shm.buf[offset:offset + length]), received)
+
+class DecodePool:
+    """Parses frames in worker processes and hands results to on_result in submission order.
+
+    Every frame - pooled, or decoded inline when it is oversized or all slots
+    are busy - goes through one ordered pending queue, so books are always
+    updated in the order frames arrived (and therefore in order per ticker).
+
+    submit() and on_result both run on `loop` (the feed thread): worker
+    completions only schedule a drain there, so books are never touched from
+    the executor's callback thread and no lock is needed.
+    """
+
+    def __init__(self, on_result, loop, workers=DECODE_WORKERS, slots=DECODE_SLOTS, slot_bytes=DECODE_SLOT_BYTES):
+        self.on_result = on_result
+        self.loop = loop
+        self.slot_bytes = slot_bytes
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(self.shm.name,)
+        )
+        self.free_slots = deque(range(slots))
+        self.pending = deque()  # (future, slot or None) in arrival order
+        self.submitted = 0
+        self.applied = 0  # counted once on_result has returned (or the frame failed)
+        self.after_applied = deque()  # (submitted count, callback) waiting for applies
+        self.inline_frames = 0
+        self.pooled_frames = 0
+        atexit.register(self.close)
+        print(f"[DECODE] Started decode pool with {workers} workers and {slots} x {slot_bytes} byte slots")
+
+    def submit(self, message_bytes, received=None):
+        if received is None:
+            received = time.time()
+        length = len(message_bytes)
+        slot = self.free_slots.popleft() if length <= self.slot_bytes and self.free_slots else None
+        if slot is None:
+            # Oversized frame or pool saturated: reserve our place in line and decode here
+            future = Future()
+            self.inline_frames += 1
+        else:
+            offset = slot * self.slot_bytes
+            self.shm.buf[offset:offset + length] = message_bytes
+            future = self.executor.submit(_decode_slot, offset, length, received)
+            self.pooled_frames += 1
+        self.pending.append((future, slot))
+        self.submitted += 1
+        if slot is None:
+            try:
+                future.set_result(decode_market_depth_columns(message_bytes, received))
+            except Exception as e:
+                future.set_exception(e)
+        future.add_done_callback(self._schedule_drain)
+
+    def _schedule_drain(self, _future):
+        # Runs on the executor's callback thread: hand over to the feed loop
+        self.loop.call_soon_threadsafe(self._drain)
+
+    def _drain(self):
+        """Apply every completed result at the head of the queue, in order (on the feed loop)"""
+        while self.pending and self.pending[0][0].done():
+            future, slot = self.pending.popleft()
+            if slot is not None:
+                self.free_slots.append(slot)
+            try:
+                self.on_result(future.result())
+            except Exception as e:
+                print(f"Error applying decoded frame: {e}")
+            self.applied += 1
+            while self.after_applied and self.after_applied[0][0] <= self.applied:
+                self._run_callback(self.after_applied.popleft()[1])
+
+    def call_after_applied(self, callback):
+        """Run callback on the feed loop once every frame submitted so far has been applied.
+
+        It runs immediately when nothing is in flight, otherwise straight
+        after the last of those frames, before any later frame is applied.
+        """
+        if self.applied >= self.submitted:
+            self._run_callback(callback)
+        else:
+            self.after_applied.append((self.submitted, callback))
+
+    @staticmethod
+    def _run_callback(callback):
+        try:
+            callback()
+        except Exception as e:
+            print(f"Error in decode pool callback: {e}")
+
+    def stats(self):
+        return {
+            'pending': len(self.pending),
+            'submitted': self.submitted,
+            'applied': self.applied,
+            'free_slots': len(self.free_slots),
+            'pooled_frames': self.pooled_frames,
+            'inline_frames': self.inline_frames,
+        }
+
+    def close(self):
+        if self.shm is None:
+            return
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
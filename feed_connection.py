@@ -0,0 +1,171 @@
+# Feed connection health, reconnect backoff and subscription bookkeeping
+import os
+import json
+import time
+import random
+import websockets
+
+RECONNECT_BASE_DELAY = float(os.getenv('RECONNECT_BASE_DELAY', '0.25'))
+RECONNECT_MAX_DELAY = float(os.getenv('RECONNECT_MAX_DELAY', '30'))
+# A connection that lived this long is considered healthy and resets backoff
+STABLE_CONNECTION_SECONDS = float(os.getenv('STABLE_CONNECTION_SECONDS', '10'))
+PING_INTERVAL_SECONDS = 30
+
+# Health states
+DISCONNECTED = 'disconnected'
+CONNECTING = 'connecting'
+CONNECTED = 'connected'
+BACKOFF = 'backoff'
+
+# Close codes that mean the server shut us down on purpose (not a network fault)
+CLEAN_CLOSE_CODES = (1000, 1001)
+
+class ConnectionManager:
+    """Tracks feed health, computes reconnect delays and owns the subscription set"""
+
+    def __init__(self, symbols=(), channel='1', base_delay=RECONNECT_BASE_DELAY, max_delay=RECONNECT_MAX_DELAY):
+        self.channel = channel
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # dict keeps insertion order so resubscription is deterministic
+        self.subscriptions = dict.fromkeys(symbols)
+        self.state = DISCONNECTED
+        self.state_since = time.time()
+        self.attempts = 0
+        self.connected_at = None
+        self.reconnects = 0
+        self.listeners = []
+
+    def add_listener(self, callback):
+        """Register callback(status_dict) invoked on every state change"""
+        self.listeners.append(callback)
+
+    def set_state(self, state):
+        if state == self.state:
+            return
+        self.state = state
+        self.state_since = time.time()
+        status = self.status()
+        for callback in self.listeners:
+            try:
+                callback(status)
+            except Exception as e:
+                print(f"Error in feed state listener: {e}")
+
+    @property
+    def stale(self):
+        return self.state != CONNECTED
+
+    def status(self):
+        return {
+            'state': self.state,
+            'stale': self.stale,
+            'since': int(self.state_since * 1000),
+            'attempts': self.attempts,
+            'reconnects': self.reconnects,
+            'symbols': list(self.subscriptions),
+        }
+
+    def on_connecting(self):
+        self.set_state(CONNECTING)
+
+    def on_connected(self):
+        if self.connected_at is not None or self.attempts:
+            self.reconnects += 1
+        self.connected_at = time.time()
+        self.set_state(CONNECTED)
+
+    def on_disconnected(self, clean=False):
+        """Record a dropped connection and return how long to wait before retrying.
+
+        A clean close after a healthy session retries immediately; anything
+        else backs off exponentially with full jitter up to max_delay.
+        """
+        lived = time.time() - self.connected_at if self.state == CONNECTED and self.connected_at else 0.0
+        if lived >= STABLE_CONNECTION_SECONDS:
+            self.attempts = 0
+        if clean and self.attempts == 0:
+            delay = 0.0
+        else:
+            ceiling = min(self.max_delay, self.base_delay * (2 ** self.attempts))
+            delay = random.uniform(0, ceiling)
+        self.attempts += 1
+        self.set_state(BACKOFF if delay else DISCONNECTED)
+        return delay
+
+    def replace_subscriptions(self, symbols):
+        self.subscriptions = dict.fromkeys(symbols)
+
+    def add_subscriptions(self, symbols):
+        for symbol in symbols:
+            self.subscriptions.setdefault(symbol)
+
+    def subscribe_messages(self, symbols=None):
+        """Build the subscribe + resume messages covering all (or the given) symbols"""
+        subscribe_msg = {
+            "type": 1,
+            "data": {
+                "subs": 1,
+                "symbols": list(symbols if symbols is not None else self.subscriptions),
+                "mode": "depth",
+                "channel": self.channel
+            }
+        }
+        resume_msg = {
+            "type": 2,
+            "data": {
+                "resumeChannels": [self.channel],
+                "pauseChannels": []
+            }
+        }
+        return [json.dumps(subscribe_msg), json.dumps(resume_msg)]
+
+async def run_session(url, auth_header, manager, on_frame, on_open=None):
+    """Run one feed connection until it drops.
+
+    Subscribes to everything in `manager`, hands each binary frame to
+    on_frame(bytes, received) - received being the local time.time() stamped
+    as soon as recv() returns - and returns True if the server closed the
+    socket cleanly.
+    Reconnect policy is left to the caller via manager.on_disconnected().
+    """
+    manager.on_connecting()
+    async with websockets.connect(
+        url,
+        extra_headers={
+            "Authorization": auth_header
+        }
+    ) as ws:
+        print("WebSocket connection established!")
+        
+        # Restore every active subscription in one go
+        for message in manager.subscribe_messages():
+            await ws.send(message)
+        print(f"Subscribed to {len(manager.subscriptions)} symbols")
+        if on_open:
+            on_open(ws)
+        manager.on_connected()
+        last_ping_time = time.time()
+        
+        while True:
+            try:
+                # Send ping every 30 seconds
+                current_time = time.time()
+                if current_time - last_ping_time >= PING_INTERVAL_SECONDS:
+                    await ws.send("ping")
+                    last_ping_time = current_time
+                    print("Ping sent")
+                
+                message = await ws.recv()
+                received = time.time()
+                if isinstance(message, bytes):
+                    on_frame(message, received)
+                else:
+                    print(f"Received text message: {message}")
+                    
+            except websockets.ConnectionClosed as e:
+                clean_close = getattr(e.rcvd, 'code', None) in CLEAN_CLOSE_CODES
+                print(f"WebSocket connection closed (clean: {clean_close})")
+                return clean_close
+            except Exception as e:
+                print(f"Error processing message: {e}")
@@ -0,0 +1,78 @@
+# Decoding of raw TBT protobuf frames into plain per-ticker updates.
+# Kept free of Flask/DB imports so feed worker processes can use it.
+import time
+from array import array
+
+import msg_pb2
+
+def decode_levels(levels):
+    """Convert repeated MarketLevel entries into level dicts"""
+    return [
+        {
+            'price': level.price.value / 100.0,
+            'qty': level.qty.value,
+            'orders': level.nord.value,
+            'level': level.num.value
+        }
+        for level in levels
+    ]
+
+def decode_level_columns(levels):
+    """Convert repeated MarketLevel entries into compact (price, qty, orders, level) arrays"""
+    prices = array('d')
+    qtys = array('Q')
+    orders = array('Q')
+    nums = array('I')
+    for level in levels:
+        prices.append(level.price.value / 100.0)
+        qtys.append(level.qty.value)
+        orders.append(level.nord.value)
+        nums.append(level.num.value)
+    return prices, qtys, orders, nums
+
+def _decode_frame(message_bytes, level_decoder, received=None):
+    if received is None:
+        received = time.time()
+    socket_message = msg_pb2.SocketMessage()
+    socket_message.ParseFromString(message_bytes)
+
+    if socket_message.error:
+        print(f"Error in socket message: {socket_message.msg}")
+        return None
+
+    updates = []
+    for ticker, feed in socket_message.feeds.items():
+        # Quote fields (OI, LTP) are only present on some feeds, e.g. options
+        quote = feed.quote if feed.HasField('quote') else None
+        updates.append({
+            'ticker': ticker,
+            'timestamp': feed.feed_time.value if feed.feed_time else None,
+            'send_time': feed.send_time.value if feed.send_time else None,
+            'received': received,
+            'oi': quote.oi.value if quote is not None and quote.HasField('oi') else None,
+            'ltp': quote.ltp.value / 100.0 if quote is not None and quote.HasField('ltp') else None,
+            'tbq': feed.depth.tbq.value if feed.depth.tbq else 0,
+            'tsq': feed.depth.tsq.value if feed.depth.tsq else 0,
+            'is_snapshot': socket_message.snapshot,
+            'bids': level_decoder(feed.depth.bids),
+            'asks': level_decoder(feed.depth.asks),
+        })
+    return updates
+
+def decode_market_depth(message_bytes, received=None):
+    """Parse a SocketMessage frame.
+
+    Returns a list of update dicts (one per ticker) ready for the order book,
+    or None if the frame carried an error. `received` is the frame's arrival
+    time (defaults to now) and is passed through for latency tracking.
+    """
+    return _decode_frame(message_bytes, decode_levels, received)
+
+def decode_market_depth_columns(message_bytes, received=None):
+    """Like decode_market_depth, but with bids/asks as columnar arrays.
+
+    This is the form shipped between processes: arrays pickle as flat
+    buffers instead of hundreds of small dicts, and update_order_book
+    applies them as they are.
+    """
+    return _decode_frame(message_bytes, decode_level_columns, received)
@@ -0,0 +1,83 @@
+"""Headless streaming API over the order book engine.
+
+Feed raw TBT frames in, get book views and analytics events out - no Flask,
+Socket.IO or database involved. Example:
+
+    from feed_engine import BookEngine
+
+    engine = BookEngine()
+    for event in engine.stream(frames):
+        if event['type'] == 'book':
+            on_book(event['ticker'], event['book'])
+        elif event['type'] == 'spoof':
+            on_spoof(event)
+
+    # or, from an async source of frames:
+    async for event in engine.astream(websocket):
+        ...
+
+Each engine keeps its own books, logging setting and order flow / spoof
+analytics; none of them touch the web app's module-level state.
+"""
+from analytics import FlowAnalytics
+from feed_decoder import decode_market_depth
+from order_book import apply_market_depth, get_book_view, get_full_order_book
+
+class BookEngine:
+    """Independent set of order books driven by raw frames"""
+
+    def __init__(self, verbose=False, analytics=True):
+        self.books = {}
+        self.frames = 0
+        self.verbose = verbose
+        self.analytics = FlowAnalytics() if analytics else False
+
+    def process(self, message_bytes):
+        """Apply one raw frame and return the resulting list of events.
+
+        Events are dicts with a 'type' key:
+          - 'book':  {'ticker', 'book'} with the same payload the dashboard receives
+          - 'spoof': {'ticker', 'side', 'price', 'qty', 'timestamp'}
+          - 'error': {'message'} when the frame could not be decoded
+        """
+        self.frames += 1
+        try:
+            updates = decode_market_depth(message_bytes)
+        except Exception as e:
+            return [{'type': 'error', 'message': str(e)}]
+        if updates is None:
+            return [{'type': 'error', 'message': 'error frame'}]
+        return self.apply(updates)
+
+    def apply(self, updates):
+        """Apply already-decoded updates (see feed_decoder) and return events"""
+        events = []
+        market_data = apply_market_depth(updates, self.books, events, verbose=self.verbose,
+                                         analytics=self.analytics) or {}
+        for ticker, payload in market_data.items():
+            events.append({'type': 'book', 'ticker': ticker, 'book': payload})
+        return events
+
+    def stream(self, frames):
+        """Generator: yield events for every frame of an iterable"""
+        for message_bytes in frames:
+            yield from self.process(message_bytes)
+
+    async def astream(self, frames):
+        """Async generator: yield events for every binary frame of an async iterable"""
+        async for message_bytes in frames:
+            if isinstance(message_bytes, bytes):
+                for event in self.process(message_bytes):
+                    yield event
+
+    def book(self, ticker):
+        """Current full book view for a ticker, or None"""
+        return get_full_order_book(ticker, self.books)
+
+    def view(self, ticker):
+        """Cached read-only view (best bid/ask, arrays, cumulative depth), or None"""
+        return get_book_view(ticker, self.books)
+
+    @property
+    def tickers(self):
+        return list(self.books)
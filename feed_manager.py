@@ -0,0 +1,236 @@
+# Per-user feeds: one deployment serving a whole team with isolated feeds.
+#
+# Every non-revoked Auth row gets its own feed connection, subscription set
+# and book set, running as one asyncio task on the feed thread. Payloads go
+# to that user's Socket.IO room only.
+#
+# With several instances behind a load balancer, a renewable lease in the
+# token store makes sure each user's feed runs on exactly one of them.
+# Logins, logouts and symbol changes are published through the store, so
+# whichever instance owns the feed reacts within a moment. Room emits reach
+# clients connected to other instances through the Socket.IO message queue.
+import os
+import asyncio
+
+from database import get_active_auth_names, get_auth_data
+from feed_connection import DISCONNECTED, ConnectionManager, run_session
+from feed_decoder import decode_market_depth
+from latency import LatencyTracker
+from order_book import apply_market_depth, build_depth_payload
+from token_store import INSTANCE_ID, get_token_store
+
+PER_USER_FEEDS = os.getenv('PER_USER_FEEDS', '').strip("'").lower() in ('1', 'true', 'yes')
+FEED_RECONCILE_SECONDS = float(os.getenv('FEED_RECONCILE_SECONDS', '10'))
+FEED_LEASE_SECONDS = float(os.getenv('FEED_LEASE_SECONDS', '30'))
+
+def user_room(name):
+    return f"user:{name}"
+
+def symbols_key(name):
+    return f"symbols:{name}"
+
+class UserFeed:
+    """One user's connection, subscriptions and books"""
+
+    def __init__(self, name, url, symbols, emit):
+        self.name = name
+        self.url = url
+        self.room = user_room(name)
+        self.emit = emit
+        self.manager = ConnectionManager(symbols)
+        self.manager.add_listener(self.on_state)
+        self.books = {}
+        self.last_market_data = {}
+        self.latency = LatencyTracker()
+        self.websocket = None
+        self.auth_header = None
+        self.task = None
+        self.frames = 0
+
+    def on_state(self, status):
+        """Feed health to this user's room; during outages the last book is re-served as stale"""
+        print(f"[USERFEED] {self.name}: {status['state']}")
+        self.emit('feed_status', status, self.room)
+        if status['stale'] and self.last_market_data:
+            self.emit('market_depth', {
+                ticker: dict(depth, stale=True) for ticker, depth in self.last_market_data.items()
+            }, self.room)
+
+    def on_open(self, ws):
+        self.websocket = ws
+
+    def on_frame(self, message_bytes, received=None):
+        self.frames += 1
+        updates = decode_market_depth(message_bytes, received)
+        if not updates:
+            return
+        market_data = apply_market_depth(updates, self.books)
+        if not market_data:
+            return
+        if self.websocket is not None:
+            self.latency.set_rtt(getattr(self.websocket, 'latency', None))
+        for ticker, depth in market_data.items():
+            self.latency.annotate(ticker, depth)
+        self.emit('market_depth', market_data, self.room)
+        self.last_market_data.update(market_data)
+
+    async def run(self, auth_header):
+        self.auth_header = auth_header
+        while True:
+            clean_close = False
+            try:
+                clean_close = await run_session(self.url, auth_header, self.manager, self.on_frame,
+                                                on_open=self.on_open)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[USERFEED] {self.name}: connection error: {e}")
+            self.websocket = None
+            delay = self.manager.on_disconnected(clean_close)
+            await asyncio.sleep(delay)
+
+    async def set_symbols(self, symbols):
+        """Replace the subscription set; new symbols are subscribed on the live connection"""
+        added = [symbol for symbol in symbols if symbol not in self.manager.subscriptions]
+        self.manager.replace_subscriptions(symbols)
+        if added and self.websocket is not None:
+            for message in self.manager.subscribe_messages(added):
+                await self.websocket.send(message)
+        for ticker in list(self.last_market_data):
+            if ticker not in self.manager.subscriptions:
+                del self.last_market_data[ticker]
+
+    def snapshot(self):
+        """Current payload of every subscribed book, for a newly connected client"""
+        payloads = {}
+        for ticker in self.manager.subscriptions:
+            if ticker in self.books:
+                payloads[ticker] = dict(build_depth_payload(ticker, self.books), stale=self.manager.stale)
+        return payloads
+
+    def status(self):
+        return dict(self.manager.status(), frames=self.frames, books=len(self.books))
+
+class FeedManager:
+    """Runs a UserFeed for every active Auth row this instance holds the lease for"""
+
+    def __init__(self, url, default_symbols, emit, broker='fyers', store=None):
+        self.url = url
+        self.default_symbols = list(default_symbols)
+        self.emit = emit
+        self.broker = broker
+        self.store = store or get_token_store()
+        self.owner = INSTANCE_ID
+        self.feeds = {}
+        self.loop = None
+        self.wake = None
+
+    def lease_key(self, name):
+        return f"feed:{self.broker}:{name}"
+
+    def symbols(self, name):
+        """Symbols selected for a user (shared across instances), or the defaults"""
+        return self.store.get(symbols_key(name)) or list(self.default_symbols)
+
+    def set_symbols(self, name, symbols):
+        """Remember a user's symbols and tell whichever instance runs their feed"""
+        symbols = list(dict.fromkeys(symbols))
+        self.store.set(symbols_key(name), symbols)
+        self.store.publish({'type': 'symbols', 'name': name})
+
+    def feed(self, name):
+        return self.feeds.get(name)
+
+    def on_message(self, message):
+        """Token store subscriber (called on the store's thread)"""
+        if self.loop is None:
+            return
+        if message.get('type') == 'symbols':
+            asyncio.run_coroutine_threadsafe(self._apply_symbols(message.get('name')), self.loop)
+        elif message.get('type') == 'auth':
+            self.loop.call_soon_threadsafe(self.wake.set)
+
+    async def _apply_symbols(self, name):
+        if name not in self.feeds:
+            return
+        symbols = await self.loop.run_in_executor(None, self.symbols, name)
+        feed = self.feeds.get(name)
+        if feed:
+            await feed.set_symbols(symbols)
+
+    @staticmethod
+    def auth_header(name):
+        auth_data = get_auth_data(name)
+        if not auth_data or not auth_data['auth_token'] or not auth_data['api_key']:
+            return None
+        return f"{auth_data['api_key']}:{auth_data['auth_token']}"
+
+    def plan(self, running):
+        """{name: (auth header, lease held, symbols)} for every active Auth row with credentials.
+
+        `running` maps the names of running feeds to their auth headers;
+        symbols are only looked up for feeds that will be (re)started.
+        Database and store calls block, so this runs in a worker thread.
+        """
+        plan = {}
+        for name in get_active_auth_names(self.broker):
+            header = self.auth_header(name)
+            if not header:
+                continue
+            leased = self.store.acquire(self.lease_key(name), self.owner, FEED_LEASE_SECONDS)
+            symbols = self.symbols(name) if leased and running.get(name) != header else None
+            plan[name] = (header, leased, symbols)
+        return plan
+
+    async def reconcile(self):
+        """Start feeds for new logins, restart on new tokens, stop on logout or a lost lease"""
+        running = {name: feed.auth_header for name, feed in self.feeds.items()}
+        plan = await self.loop.run_in_executor(None, self.plan, running)
+        for name in list(self.feeds):
+            header, leased, _ = plan.get(name, (None, False, None))
+            if leased and header == self.feeds[name].auth_header:
+                continue
+            self.stop(name, keep_lease=leased)
+        for name, (header, leased, symbols) in plan.items():
+            if leased and name not in self.feeds and symbols is not None:
+                self.start(name, header, symbols)
+
+    def start(self, name, auth_header, symbols):
+        feed = self.feeds[name] = UserFeed(name, self.url, symbols, self.emit)
+        feed.task = asyncio.ensure_future(feed.run(auth_header))
+        print(f"[USERFEED] Started feed for {name} ({len(feed.manager.subscriptions)} symbols)")
+
+    def stop(self, name, keep_lease=False):
+        feed = self.feeds.pop(name)
+        feed.task.cancel()
+        feed.manager.set_state(DISCONNECTED)
+        if not keep_lease:
+            self.loop.run_in_executor(None, self._release, name)
+        print(f"[USERFEED] Stopped feed for {name}")
+
+    def _release(self, name):
+        try:
+            self.store.release(self.lease_key(name), self.owner)
+        except Exception as e:
+            print(f"[USERFEED] Could not release the lease for {name}: {e}")
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.wake = asyncio.Event()
+        self.store.subscribe(self.on_message)
+        while True:
+            try:
+                await self.reconcile()
+            except Exception as e:
+                print(f"[USERFEED] Reconcile failed: {e}")
+            try:
+                await asyncio.wait_for(self.wake.wait(), FEED_RECONCILE_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+
+    def status(self):
+        return {
+            'instance': self.owner,
+            'feeds': {name: feed.status() for name, feed in self.feeds.items()},
+        }
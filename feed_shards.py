@@ -0,0 +1,104 @@
+# Spread the watchlist over several feed connections, one worker process each.
+# Workers connect and decode; the parent merges updates into one book registry.
+import os
+import zlib
+import queue
+import asyncio
+import multiprocessing
+
+from feed_connection import ConnectionManager, run_session, CONNECTED, CONNECTING, BACKOFF
+from feed_decoder import decode_market_depth_columns
+
+FEED_CONNECTIONS = max(1, int(os.getenv('FEED_CONNECTIONS', '1')))
+
+def shard_for_symbol(symbol, shard_count):
+    """Stable symbol -> shard mapping (independent of Python's hash seed)"""
+    return zlib.crc32(symbol.encode()) % shard_count
+
+def assign_shards(symbols, shard_count):
+    shards = [[] for _ in range(shard_count)]
+    for symbol in symbols:
+        shards[shard_for_symbol(symbol, shard_count)].append(symbol)
+    return shards
+
+def _shard_main(shard_id, url, auth_header, symbols, out_queue):
+    """Worker process entry point: keep one connection alive and ship decoded updates"""
+    manager = ConnectionManager(symbols)
+    manager.add_listener(lambda status: out_queue.put(('status', shard_id, status)))
+
+    def on_frame(message_bytes, received):
+        updates = decode_market_depth_columns(message_bytes, received)
+        if updates:
+            out_queue.put(('updates', shard_id, updates))
+
+    async def connection_loop():
+        while True:
+            clean_close = False
+            try:
+                clean_close = await run_session(url, auth_header, manager, on_frame)
+            except Exception as e:
+                print(f"[SHARD {shard_id}] Connection error: {e}")
+            delay = manager.on_disconnected(clean_close)
+            print(f"[SHARD {shard_id}] Retrying connection in {delay:.2f} seconds...")
+            await asyncio.sleep(delay)
+
+    print(f"[SHARD {shard_id}] Starting with {len(symbols)} symbols")
+    asyncio.run(connection_loop())
+
+class ShardedFeed:
+    """Owns the shard worker processes and the queue they publish decoded updates on"""
+
+    def __init__(self, url, shard_count=FEED_CONNECTIONS):
+        self.url = url
+        self.shard_count = shard_count
+        self.processes = []
+        self.queue = None
+        self.shard_states = {}
+        self.restart_pending = False
+
+    @property
+    def running(self):
+        return bool(self.processes)
+
+    def start(self, auth_header, symbols):
+        self.stop()
+        self.queue = multiprocessing.Queue()
+        self.restart_pending = False
+        for shard_id, shard_symbols in enumerate(assign_shards(symbols, self.shard_count)):
+            if not shard_symbols:
+                continue
+            process = multiprocessing.Process(
+                target=_shard_main,
+                args=(shard_id, self.url, auth_header, shard_symbols, self.queue),
+                name=f'feed-shard-{shard_id}',
+                daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+            self.shard_states[shard_id] = CONNECTING
+        print(f"[SHARDS] Started {len(self.processes)} feed connections for {len(symbols)} symbols")
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join(timeout=5)
+        self.processes = []
+        self.shard_states = {}
+
+    def get(self, timeout=1.0):
+        """Return the next (kind, shard_id, payload) item, or None on timeout"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def update_state(self, shard_id, state):
+        """Record a shard's state and return the aggregate state of the whole feed"""
+        self.shard_states[shard_id] = state
+        states = self.shard_states.values()
+        if all(s == CONNECTED for s in states):
+            return CONNECTED
+        if any(s == CONNECTING for s in states):
+            return CONNECTING
+        return BACKOFF
@@ -0,0 +1,66 @@
+# Downsampled time x price liquidity heatmap columns for the dashboard
+import os
+import time
+
+HEATMAP_INTERVAL_MS = int(os.getenv('HEATMAP_INTERVAL_MS', '250'))
+HEATMAP_TICK_SIZE = float(os.getenv('HEATMAP_TICK_SIZE', '0.05'))
+HEATMAP_ROWS = int(os.getenv('HEATMAP_ROWS', '200'))
+
+# Per-ticker sampling state: next column due time and the current price anchor
+heatmap_state = {}
+
+def _price_to_tick(price):
+    return int(round(price / HEATMAP_TICK_SIZE))
+
+def sample_heatmap(ticker, bid_prices, bid_qtys, ask_prices, ask_qtys, now=None):
+    """Return a heatmap column for the ticker once per interval, otherwise None.
+
+    Columns are sampled from the current book (last value in the interval) so
+    the cost per message is a single time comparison. Quantities are laid out
+    densely over HEATMAP_ROWS price rows starting at `base_tick`.
+    """
+    if now is None:
+        now = time.time()
+    state = heatmap_state.get(ticker)
+    if state is None:
+        state = heatmap_state[ticker] = {'due': 0.0, 'base_tick': None}
+    if now < state['due']:
+        return None
+    if not bid_prices or not ask_prices:
+        return None
+    state['due'] = now + HEATMAP_INTERVAL_MS / 1000.0
+
+    best_bid = bid_prices[0]
+    best_ask = ask_prices[0]
+    mid_tick = _price_to_tick((best_bid + best_ask) / 2)
+
+    # Only re-anchor when the mid drifts out of the middle half of the grid,
+    # so consecutive columns share a price axis and the client redraws less
+    base_tick = state['base_tick']
+    quarter = HEATMAP_ROWS // 4
+    if base_tick is None or not (base_tick + quarter <= mid_tick < base_tick + HEATMAP_ROWS - quarter):
+        base_tick = mid_tick - HEATMAP_ROWS // 2
+        state['base_tick'] = base_tick
+
+    bids = [0] * HEATMAP_ROWS
+    asks = [0] * HEATMAP_ROWS
+    for price, qty in zip(bid_prices, bid_qtys):
+        row = _price_to_tick(price) - base_tick
+        if 0 <= row < HEATMAP_ROWS:
+            bids[row] += qty
+    for price, qty in zip(ask_prices, ask_qtys):
+        row = _price_to_tick(price) - base_tick
+        if 0 <= row < HEATMAP_ROWS:
+            asks[row] += qty
+
+    return {
+        'ticker': ticker,
+        'time': int(now * 1000),
+        'tick_size': HEATMAP_TICK_SIZE,
+        'base_tick': base_tick,
+        'rows': HEATMAP_ROWS,
+        'best_bid': best_bid,
+        'best_ask': best_ask,
+        'bids': bids,
+        'asks': asks,
+    }
@@ -0,0 +1,134 @@
+# Multi-resolution in-memory history of book metrics for dashboard charts.
+#
+# Every symbol gets one fixed-size ring per resolution (1s, 10s, 1m). Each ring
+# slot is a time bucket holding min/max/last/sum/count per metric in flat
+# arrays, so recording a message is a few array writes and memory is bounded
+# by HISTORY_POINTS regardless of message rate.
+import os
+import time
+import bisect
+from array import array
+
+HISTORY_POINTS = int(os.getenv('HISTORY_POINTS', '3600'))  # buckets kept per resolution
+
+RESOLUTIONS = {'1s': 1, '10s': 10, '1m': 60}
+METRICS = ('imbalance', 'spread_bps', 'microprice')
+
+def extract_metrics(payload):
+    """Chart metrics from a market_depth payload; None where a side is empty"""
+    bids = payload['bids']
+    asks = payload['asks']
+    if not bids or not asks:
+        return {'imbalance': payload['imbalance_10']['imbalance_pct'], 'spread_bps': None, 'microprice': None}
+    best_bid, best_ask = bids[0], asks[0]
+    total = best_bid['quantity'] + best_ask['quantity']
+    if total:
+        # Top-of-book size weighted: leans towards the side with less size
+        microprice = (best_bid['price'] * best_ask['quantity'] + best_ask['price'] * best_bid['quantity']) / total
+    else:
+        microprice = (best_bid['price'] + best_ask['price']) / 2
+    return {
+        'imbalance': payload['imbalance_10']['imbalance_pct'],
+        'spread_bps': payload['spread_bps'],
+        'microprice': microprice,
+    }
+
+class SeriesRing:
+    """Fixed-size ring of time buckets with per-metric min/max/last/sum/count"""
+
+    def __init__(self, seconds, points=HISTORY_POINTS):
+        self.seconds = seconds
+        self.points = points
+        self.times = array('d', [0.0]) * points
+        self.columns = {
+            metric: {
+                'min': array('d', [0.0]) * points,
+                'max': array('d', [0.0]) * points,
+                'last': array('d', [0.0]) * points,
+                'sum': array('d', [0.0]) * points,
+                'count': array('I', [0]) * points,
+            }
+            for metric in METRICS
+        }
+        self.head = -1
+        self.size = 0
+        self.bucket = None
+
+    def add(self, now, values):
+        bucket = int(now // self.seconds)
+        # A clock step backwards folds into the current bucket to keep times sorted
+        if self.bucket is None or bucket > self.bucket:
+            self.bucket = bucket
+            self.head = (self.head + 1) % self.points
+            self.size = min(self.size + 1, self.points)
+            self.times[self.head] = bucket * self.seconds
+            for column in self.columns.values():
+                column['count'][self.head] = 0
+                column['sum'][self.head] = 0.0
+        head = self.head
+        for metric, value in values.items():
+            if value is None:
+                continue
+            column = self.columns[metric]
+            if column['count'][head]:
+                if value < column['min'][head]:
+                    column['min'][head] = value
+                if value > column['max'][head]:
+                    column['max'][head] = value
+            else:
+                column['min'][head] = value
+                column['max'][head] = value
+            column['last'][head] = value
+            column['sum'][head] += value
+            column['count'][head] += 1
+
+    def _chronological(self, values):
+        if self.size < self.points:
+            return values[:self.size]
+        return values[self.head + 1:] + values[:self.head + 1]
+
+    def query(self, since=None, limit=None, metrics=METRICS):
+        """Columnar buckets with time >= since (oldest first), at most `limit` of the newest"""
+        times = self._chronological(self.times)
+        start = bisect.bisect_left(times, since) if since else 0
+        if limit:
+            start = max(start, len(times) - limit)
+        result = {'resolution': self.seconds, 'time': times[start:].tolist()}
+        for metric in metrics:
+            column = self.columns[metric]
+            counts = self._chronological(column['count'])[start:]
+            series = {'mean': [total / count if count else None
+                               for total, count in zip(self._chronological(column['sum'])[start:], counts)]}
+            for stat in ('min', 'max', 'last'):
+                series[stat] = [value if count else None
+                                for value, count in zip(self._chronological(column[stat])[start:], counts)]
+            result[metric] = series
+        return result
+
+class HistoryStore:
+    """Per-symbol SeriesRings at every resolution, fed from the publish path"""
+
+    def __init__(self, points=HISTORY_POINTS):
+        self.points = points
+        self.symbols = {}
+
+    def record(self, ticker, payload, now=None):
+        if now is None:
+            now = time.time()
+        rings = self.symbols.get(ticker)
+        if rings is None:
+            rings = self.symbols[ticker] = {
+                name: SeriesRing(seconds, self.points) for name, seconds in RESOLUTIONS.items()
+            }
+        values = extract_metrics(payload)
+        for ring in rings.values():
+            ring.add(now, values)
+
+    def query(self, ticker, resolution='1s', since=None, limit=None, metrics=METRICS):
+        """History for one symbol at a resolution name ('1s', '10s', '1m'), or None if unknown"""
+        rings = self.symbols.get(ticker)
+        if rings is None:
+            return None
+        result = rings[resolution].query(since, limit, metrics)
+        result['ticker'] = ticker
+        return result
@@ -0,0 +1,139 @@
+# Per-message latency tracking from the feed's own timestamps.
+#
+# Each depth update carries feed_time (exchange event) and send_time (broker
+# send); we add our receive time, stamped as soon as the frame comes off the
+# socket. Broker and local clocks are not synchronised, so the clock offset is
+# estimated from the minimum of (received - send_time): the fastest message is
+# assumed to have taken half a WebSocket ping round trip (or ~0 before the
+# first pong).
+#
+# The estimate follows a lower minimum at once but may only rise by
+# OFFSET_MAX_DRIFT_MS per OFFSET_WINDOW_SECONDS, enough for real clock drift.
+# A sustained delay therefore shows up as lag instead of being folded into
+# the offset after one window.
+import os
+import time
+from collections import deque
+
+STALE_THRESHOLD_MS = float(os.getenv('STALE_THRESHOLD_MS', '2000'))
+OFFSET_WINDOW_SECONDS = float(os.getenv('OFFSET_WINDOW_SECONDS', '60'))
+OFFSET_MAX_DRIFT_MS = float(os.getenv('OFFSET_MAX_DRIFT_MS', '5'))
+
+def to_seconds(value):
+    """Feed timestamps arrive as epoch seconds or epoch milliseconds"""
+    if not value:
+        return None
+    return value / 1000.0 if value > 1e11 else float(value)
+
+def percentiles(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+    last = len(ordered) - 1
+    return {
+        'p50': round(ordered[last // 2], 2),
+        'p99': round(ordered[int(last * 0.99)], 2),
+        'max': round(ordered[last], 2),
+    }
+
+class LatencyTracker:
+    """Estimates clock offset and per-message delays; flags data older than the threshold"""
+
+    def __init__(self, stale_threshold_ms=STALE_THRESHOLD_MS, window=OFFSET_WINDOW_SECONDS, buckets=6,
+                 max_drift_ms=OFFSET_MAX_DRIFT_MS):
+        self.stale_threshold_ms = stale_threshold_ms
+        self.bucket_seconds = window / buckets
+        self.buckets = buckets
+        self.max_step = max_drift_ms / 1000.0 / buckets  # upward move allowed per bucket
+        self.min_transit = deque()  # [bucket id, minimum raw transit] for the last `buckets` buckets
+        self.base_transit = None  # long-horizon minimum raw transit
+        self.rtt = None
+        self.messages = 0
+        self.stale_messages = 0
+        self.age_ms = deque(maxlen=2048)
+        self.transit_ms = deque(maxlen=2048)
+        self.exchange_ms = deque(maxlen=2048)
+        self.last = {}  # ticker -> latest latency dict
+
+    def set_rtt(self, rtt):
+        """Round trip time in seconds from the WebSocket keepalive, if known"""
+        if rtt:
+            self.rtt = rtt
+
+    @property
+    def offset(self):
+        """Estimated (local clock - broker clock) in seconds"""
+        if self.base_transit is None:
+            return 0.0
+        return self.base_transit - (self.rtt or 0.0) / 2
+
+    def _track_minimum(self, raw_transit, received):
+        bucket = int(received // self.bucket_seconds)
+        if self.min_transit and self.min_transit[-1][0] == bucket:
+            if raw_transit < self.min_transit[-1][1]:
+                self.min_transit[-1][1] = raw_transit
+        else:
+            if self.min_transit:
+                # A bucket closed: let the estimate creep up towards the windowed minimum
+                window_min = min(entry[1] for entry in self.min_transit)
+                if window_min > self.base_transit:
+                    self.base_transit += min(window_min - self.base_transit, self.max_step)
+            self.min_transit.append([bucket, raw_transit])
+        while self.min_transit[0][0] <= bucket - self.buckets:
+            self.min_transit.popleft()
+        if self.base_transit is None or raw_transit < self.base_transit:
+            self.base_transit = raw_transit
+
+    def observe(self, ticker, feed_time, send_time, received, now=None):
+        """Record one update and return its latency breakdown in ms, or None without send_time"""
+        send_s = to_seconds(send_time)
+        if send_s is None or received is None:
+            return None
+        now = now or time.time()
+        feed_s = to_seconds(feed_time)
+        self._track_minimum(received - send_s, received)
+        offset = self.offset
+        transit = (received - offset - send_s) * 1000
+        processing = (now - received) * 1000
+        age = transit + processing
+        # feed_time often has whole-second resolution, so exchange delay is coarse
+        exchange = (send_s - feed_s) * 1000 if feed_s else None
+        stale = age > self.stale_threshold_ms
+        info = {
+            'exchange_ms': round(exchange, 1) if exchange is not None else None,
+            'transit_ms': round(transit, 1),
+            'processing_ms': round(processing, 1),
+            'age_ms': round(age, 1),
+            'offset_ms': round(offset * 1000, 1),
+            'stale': stale,
+        }
+        self.messages += 1
+        if stale:
+            self.stale_messages += 1
+        self.age_ms.append(age)
+        self.transit_ms.append(transit)
+        if exchange is not None:
+            self.exchange_ms.append(exchange)
+        self.last[ticker] = info
+        return info
+
+    def annotate(self, ticker, payload, now=None):
+        """Attach latency to a market_depth payload, marking it stale when too old"""
+        info = self.observe(ticker, payload.get('timestamp'), payload.get('send_time'), payload.get('received'), now)
+        payload['latency'] = info
+        if info and info['stale']:
+            payload['stale'] = True
+        return info
+
+    def stats(self):
+        return {
+            'messages': self.messages,
+            'stale_messages': self.stale_messages,
+            'stale_threshold_ms': self.stale_threshold_ms,
+            'offset_ms': round(self.offset * 1000, 1),
+            'rtt_ms': round(self.rtt * 1000, 1) if self.rtt else None,
+            'age_ms': percentiles(self.age_ms),
+            'transit_ms': percentiles(self.transit_ms),
+            'exchange_ms': percentiles(self.exchange_ms),
+            'symbols': dict(self.last),
+        }
@@ -0,0 +1,217 @@
+"""Local mock of the Fyers TBT depth feed for load and soak testing.
+
+Speaks the same protocol websocket_client uses: accepts the subscribe
+(type 1) and resume (type 2) JSON messages and streams msg_pb2.SocketMessage
+depth frames for the subscribed symbols.
+
+Usage:
+    python mock_feed_server.py --port 8765 --rate 2000 --symbols 20
+    WEBSOCKET_URL=ws://127.0.0.1:8765 python app.py
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+
+import websockets
+
+import msg_pb2
+
+LEVELS = 50
+
+class MockBook:
+    """Random-walk 50-level book for one symbol, kept in integer paise"""
+
+    def __init__(self, symbol, mid, tick):
+        self.symbol = symbol
+        self.tick = tick
+        self.mid = mid
+        self.sequence_no = 0
+        self.oi = random.randint(1000, 50000) * 75
+        self.bids = [[mid - (i + 1) * tick, random.randint(1, 40) * 75, random.randint(1, 20)] for i in range(LEVELS)]
+        self.asks = [[mid + (i + 1) * tick, random.randint(1, 40) * 75, random.randint(1, 20)] for i in range(LEVELS)]
+
+    def step(self, changes):
+        """Mutate the book and return the (side, level) pairs that changed"""
+        changed = set()
+        if random.random() < 0.05:
+            # Mid moves: every level reprices
+            self.mid += random.choice((-1, 1)) * self.tick
+            for i in range(LEVELS):
+                self.bids[i][0] = self.mid - (i + 1) * self.tick
+                self.asks[i][0] = self.mid + (i + 1) * self.tick
+            return [('bids', i) for i in range(LEVELS)] + [('asks', i) for i in range(LEVELS)]
+        for _ in range(changes):
+            side = random.choice(('bids', 'asks'))
+            level = min(int(random.expovariate(0.15)), LEVELS - 1)
+            entry = getattr(self, side)[level]
+            entry[1] = max(0, entry[1] + random.randint(-10, 10) * 75)
+            entry[2] = max(0, entry[2] + random.randint(-2, 2)) if entry[1] else 0
+            changed.add((side, level))
+        return sorted(changed)
+
+    def fill_feed(self, feed, snapshot, changed, now, extra_gap=0):
+        self.sequence_no += 1 + extra_gap
+        feed.ticker = self.symbol
+        feed.sequence_no = self.sequence_no
+        feed.snapshot = snapshot
+        feed.feed_time.value = int(now)
+        feed.send_time.value = int(now * 1000)
+        # Open interest drifts slowly; LTP sits between the best bid and ask
+        self.oi = max(0, self.oi + random.randint(-2, 2) * 75)
+        feed.quote.oi.value = self.oi
+        feed.quote.ltp.value = random.choice((self.bids[0][0], self.asks[0][0]))
+        feed.depth.tbq.value = sum(level[1] for level in self.bids)
+        feed.depth.tsq.value = sum(level[1] for level in self.asks)
+        entries = [('bids', i) for i in range(LEVELS)] + [('asks', i) for i in range(LEVELS)] if snapshot else changed
+        for side, i in entries:
+            price, qty, orders = getattr(self, side)[i]
+            level = getattr(feed.depth, side).add()
+            level.price.value = price
+            level.qty.value = qty
+            level.nord.value = orders
+            level.num.value = i
+
+class MockFeedServer:
+    def __init__(self, args):
+        self.args = args
+        self.books = {}
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.clients = 0
+
+    def book_for(self, symbol):
+        if symbol not in self.books:
+            mid = random.randint(2000000, 2600000) // self.args.tick * self.args.tick
+            self.books[symbol] = MockBook(symbol, mid, self.args.tick)
+        return self.books[symbol]
+
+    def build_frame(self, symbols, snapshot, now):
+        message = msg_pb2.SocketMessage()
+        message.type = msg_pb2.depth
+        message.snapshot = snapshot
+        for symbol in symbols:
+            book = self.book_for(symbol)
+            changed = [] if snapshot else book.step(self.args.changes)
+            gap = random.randint(1, 5) if random.random() < self.args.gap_rate else 0
+            book.fill_feed(message.feeds[symbol], snapshot, changed, now, gap)
+        return message.SerializeToString()
+
+    async def handler(self, websocket, path=None):
+        self.clients += 1
+        print(f"[MOCK] Client connected (auth header present: {'Authorization' in websocket.request_headers})")
+        # Pre-created symbols (--symbols) stream to every client on top of its subscriptions
+        subscribed = list(self.books) if self.args.symbols else []
+        streaming = asyncio.Event()
+        stream_task = asyncio.ensure_future(self.stream(websocket, subscribed, streaming))
+        try:
+            async for raw in websocket:
+                if raw == "ping":
+                    continue
+                try:
+                    message = json.loads(raw)
+                except (TypeError, ValueError):
+                    print(f"[MOCK] Ignoring non-JSON message: {raw!r}")
+                    continue
+                data = message.get('data', {})
+                if message.get('type') == 1:
+                    for symbol in data.get('symbols', []):
+                        if data.get('subs', 1) == -1:
+                            if symbol in subscribed:
+                                subscribed.remove(symbol)
+                        elif symbol not in subscribed:
+                            subscribed.append(symbol)
+                            # New subscriptions always start with a snapshot
+                            await websocket.send(self.build_frame([symbol], True, time.time()))
+                    print(f"[MOCK] Subscribed symbols: {len(subscribed)}")
+                elif message.get('type') == 2:
+                    streaming.set()
+                    print(f"[MOCK] Resumed channels: {data.get('resumeChannels')}")
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            stream_task.cancel()
+            self.clients -= 1
+            print("[MOCK] Client disconnected")
+
+    async def stream(self, websocket, subscribed, streaming):
+        await streaming.wait()
+        args = self.args
+        for start in range(0, len(subscribed), 50):
+            await websocket.send(self.build_frame(subscribed[start:start + 50], True, time.time()))
+        next_send = time.perf_counter()
+        connected_at = time.time()
+        frame_count = 0
+        while True:
+            if args.disconnect_every and time.time() - connected_at >= args.disconnect_every:
+                print("[MOCK] Injecting disconnect")
+                if args.clean_close:
+                    await websocket.close(code=1000)
+                else:
+                    websocket.transport.abort()
+                return
+            if subscribed:
+                frame_count += 1
+                snapshot = args.snapshot_every > 0 and frame_count % args.snapshot_every == 0
+                symbols = random.sample(subscribed, min(args.batch, len(subscribed)))
+                frame = self.build_frame(symbols, snapshot, time.time())
+                if random.random() < args.drop_rate:
+                    self.frames_dropped += 1
+                else:
+                    await websocket.send(frame)
+                    self.frames_sent += 1
+            # args.rate is re-read on every frame so bench_e2e.py can re-rate a running server
+            next_send += 1.0 / args.rate
+            delay = next_send - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif delay < -1.0:
+                # Too far behind: don't try to catch up with a burst
+                next_send = time.perf_counter()
+
+    async def report(self):
+        last = 0
+        while True:
+            await asyncio.sleep(10)
+            rate = (self.frames_sent - last) / 10
+            last = self.frames_sent
+            print(f"[MOCK] clients={self.clients} sent={self.frames_sent} dropped={self.frames_dropped} rate={rate:.0f}/s")
+
+    async def run(self):
+        async with websockets.serve(self.handler, self.args.host, self.args.port, max_size=None):
+            print(f"[MOCK] Fyers TBT mock listening on ws://{self.args.host}:{self.args.port}")
+            await self.report()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Mock Fyers TBT depth feed")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--rate', type=float, default=500, help='frames per second per connection')
+    parser.add_argument('--symbols', type=int, default=0,
+                        help='stream N synthetic symbols to every client in addition to its subscriptions')
+    parser.add_argument('--batch', type=int, default=1, help='symbols carried per frame')
+    parser.add_argument('--changes', type=int, default=3, help='levels changed per incremental update')
+    parser.add_argument('--snapshot-every', type=int, default=1000, help='send a snapshot every N frames (0 = never)')
+    parser.add_argument('--tick', type=int, default=5, help='tick size in paise')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='probability of silently dropping a frame')
+    parser.add_argument('--gap-rate', type=float, default=0.0, help='probability of skipping sequence numbers')
+    parser.add_argument('--disconnect-every', type=float, default=0.0, help='drop each connection after N seconds')
+    parser.add_argument('--clean-close', action='store_true', help='disconnect with close code 1000 instead of aborting')
+    parser.add_argument('--seed', type=int, default=None)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.seed is not None:
+        random.seed(args.seed)
+    server = MockFeedServer(args)
+    for i in range(args.symbols):
+        server.book_for(f"NSE:MOCK{i}-EQ")
+    try:
+        asyncio.run(server.run())
+    except KeyboardInterrupt:
+        print("[MOCK] Stopped")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+# Option-chain table over the depth feed.
+#
+# One row per strike, with calls and puts side by side in columnar arrays
+# (best bid/ask and their sizes, tbq/tsq, OI, LTP). Each book update for a
+# strike writes a handful of array slots; the dashboard gets the whole chain
+# as one conflated 'option_chain' event at most every OPTION_CHAIN_INTERVAL_MS
+# instead of a full depth payload per strike.
+import os
+import time
+from array import array
+
+from order_book import get_top_of_book
+
+OPTION_CHAIN_UNDERLYING = os.getenv('OPTION_CHAIN_UNDERLYING', '').strip("'")  # e.g. NSE:NIFTY; empty = disabled
+OPTION_CHAIN_EXPIRY = os.getenv('OPTION_CHAIN_EXPIRY', '').strip("'")          # e.g. 25JUL or 25710
+OPTION_CHAIN_STRIKES = os.getenv('OPTION_CHAIN_STRIKES', '').strip("'")        # "24000-26000:50" or "24000,24100"
+OPTION_CHAIN_INTERVAL_MS = int(os.getenv('OPTION_CHAIN_INTERVAL_MS', '500'))
+
+OPTION_TYPES = ('CE', 'PE')
+COLUMNS = {
+    'bid': 'd', 'ask': 'd', 'ltp': 'd',
+    'bid_qty': 'Q', 'ask_qty': 'Q', 'tbq': 'Q', 'tsq': 'Q', 'oi': 'Q',
+}
+
+def parse_strikes(spec):
+    """'24000-26000:50' (inclusive range with step) or '24000,24050,...' -> sorted strikes"""
+    strikes = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part[1:]:
+            bounds, _, step = part.partition(':')
+            low, high = (float(x) for x in bounds.split('-', 1))
+            step = float(step or 50)
+            count = int(round((high - low) / step))
+            strikes.update(low + i * step for i in range(count + 1))
+        else:
+            strikes.add(float(part))
+    return sorted(strikes)
+
+def format_strike(strike):
+    return str(int(strike)) if strike == int(strike) else f"{strike:g}"
+
+def option_symbol(underlying, expiry, strike, option_type):
+    """Fyers option ticker, e.g. NSE:NIFTY25JUL25000CE"""
+    return f"{underlying}{expiry}{format_strike(strike)}{option_type}"
+
+class OptionChain:
+    """Columnar per-strike table for one underlying and expiry"""
+
+    def __init__(self, underlying, expiry, strikes, interval_ms=OPTION_CHAIN_INTERVAL_MS):
+        self.underlying = underlying
+        self.expiry = expiry
+        self.strikes = list(strikes)
+        self.interval = interval_ms / 1000.0
+        count = len(self.strikes)
+        self.columns = {
+            option_type: {name: array(code, [0]) * count for name, code in COLUMNS.items()}
+            for option_type in OPTION_TYPES
+        }
+        # ticker -> (columns of its option type, strike index)
+        self.rows = {}
+        for index, strike in enumerate(self.strikes):
+            for option_type in OPTION_TYPES:
+                ticker = option_symbol(underlying, expiry, strike, option_type)
+                self.rows[ticker] = (self.columns[option_type], index)
+        self.version = 0
+        self.published_version = 0
+        self.next_publish = 0.0
+
+    @property
+    def symbols(self):
+        return list(self.rows)
+
+    def update(self, ticker, book, books=None):
+        """Refresh a strike from its book; returns False if the ticker is not part of the chain"""
+        row = self.rows.get(ticker)
+        if row is None:
+            return False
+        columns, index = row
+        best_bid, best_ask = get_top_of_book(ticker, books)
+        columns['bid'][index] = best_bid['price'] if best_bid else 0.0
+        columns['bid_qty'][index] = best_bid['qty'] if best_bid else 0
+        columns['ask'][index] = best_ask['price'] if best_ask else 0.0
+        columns['ask_qty'][index] = best_ask['qty'] if best_ask else 0
+        columns['tbq'][index] = book['tbq']
+        columns['tsq'][index] = book['tsq']
+        columns['oi'][index] = book.get('oi') or 0
+        columns['ltp'][index] = book.get('ltp') or 0.0
+        self.version += 1
+        return True
+
+    def snapshot(self):
+        """The whole chain as plain lists, one list per column per option type"""
+        chain = {
+            'underlying': self.underlying,
+            'expiry': self.expiry,
+            'time': time.time(),
+            'strikes': self.strikes,
+        }
+        for option_type, columns in self.columns.items():
+            chain[option_type] = {name: column.tolist() for name, column in columns.items()}
+        chain['pcr'] = round(sum(chain['PE']['oi']) / sum(chain['CE']['oi']), 3) if sum(chain['CE']['oi']) else None
+        return chain
+
+    def due(self, now=None):
+        """Conflated publish: a snapshot when something changed and the interval has passed, else None"""
+        if self.version == self.published_version:
+            return None
+        now = now or time.time()
+        if now < self.next_publish:
+            return None
+        self.next_publish = now + self.interval
+        self.published_version = self.version
+        return self.snapshot()
+
+def create_option_chain():
+    """OptionChain from the OPTION_CHAIN_* settings, or None when not configured"""
+    if not OPTION_CHAIN_UNDERLYING:
+        return None
+    strikes = parse_strikes(OPTION_CHAIN_STRIKES)
+    if not OPTION_CHAIN_EXPIRY or not strikes:
+        print("[CHAIN] OPTION_CHAIN_UNDERLYING is set but OPTION_CHAIN_EXPIRY/OPTION_CHAIN_STRIKES are missing")
+        return None
+    chain = OptionChain(OPTION_CHAIN_UNDERLYING, OPTION_CHAIN_EXPIRY, strikes)
+    print(f"[CHAIN] Tracking {len(strikes)} strikes ({len(chain.rows)} contracts) of "
+          f"{OPTION_CHAIN_UNDERLYING} {OPTION_CHAIN_EXPIRY}")
+    return chain
@@ -0,0 +1,525 @@
+# Order book engine: maintains the 50-level books and builds display payloads.
+# Depends only on the decoder and analytics, so it can be imported without
+# Flask, Flask-SocketIO or the database.
+from analytics import default_analytics, spread_opportunity
+from feed_decoder import decode_market_depth
+
+# Global order book storage for maintaining full depth
+order_books = {}
+
+# Per-update console logging for the module-level books. Every apply
+# function also takes `verbose` and `analytics` arguments, so an embedder
+# (see feed_engine) can keep its own settings without touching these.
+verbose = True
+
+def set_verbose(enabled):
+    global verbose
+    verbose = enabled
+
+# Flow/large-order/spoof analytics on level changes; optional work that the
+# overload controller can shed (the books themselves are always updated)
+analytics_enabled = True
+
+def set_analytics(enabled):
+    global analytics_enabled
+    analytics_enabled = enabled
+
+def _settings(verbose_flag, analytics):
+    """Resolve per-call settings: None means the module defaults, analytics=False turns analytics off"""
+    if verbose_flag is None:
+        verbose_flag = verbose
+    if analytics is None:
+        analytics = default_analytics if analytics_enabled else False
+    return verbose_flag, analytics
+
+def _silent(*args):
+    pass
+
+def _level_tuples(levels):
+    """(price, qty, orders, level) per updated level, from level dicts or decode_level_columns arrays"""
+    if isinstance(levels, tuple):
+        return zip(*levels)
+    return ((level['price'], level['qty'], level['orders'], level['level']) for level in levels)
+
+def _level_count(levels):
+    return len(levels[0]) if isinstance(levels, tuple) else len(levels)
+
+def _apply_side(ticker, side_name, side, levels, timestamp, events, log, analytics):
+    """Apply one side's level updates in place (level dicts are reused, never replaced).
+
+    Returns (moved, changed): whether any level's price changed, and the
+    levels whose qty or orders changed at an unchanged price.
+    """
+    label = side_name.upper()
+    moved = False
+    changed = []
+    for price, qty, orders, level in _level_tuples(levels):
+        if not 0 <= level < 50:
+            continue
+        entry = side[level]
+        old_price = entry['price']
+        old_qty = entry['qty']
+        old_orders = entry['orders']
+        # Optional analytics; skipped under overload, the level update below never is
+        if analytics:
+            analytics.update_order_flow(old_qty, qty)
+            if qty > old_qty:
+                analytics.record_large_order(price, qty, side_name, timestamp)
+            elif qty < old_qty:
+                if analytics.detect_spoofing(price, qty, side_name, timestamp):
+                    log(f"[SPOOFING] Potential {side_name} spoof at {price}")
+                    if events is not None:
+                        events.append({'type': 'spoof', 'ticker': ticker, 'side': side_name,
+                                       'price': price, 'qty': qty, 'timestamp': timestamp})
+        
+        if price == 0.0 and qty > 0:
+            if old_price > 0:
+                entry['qty'] = qty
+                entry['orders'] = orders
+                # Only log invalid data occasionally to reduce noise
+                if level % 10 == 0:  # Log every 10th level only
+                    log(f"   [{label}] Level {level}: Invalid data corrected (price preserved)")
+            # Skip invalid updates without valid old price
+        elif qty == 0:
+            if price == 0.0 and old_price > 0:
+                entry['qty'] = 0
+                entry['orders'] = orders
+                log(f"   [{label}] {label} Level {level}: {old_price:.2f} qty:0 orders:{orders} (preserving level)")
+            elif price > 0:
+                entry['price'] = price
+                entry['qty'] = 0
+                entry['orders'] = orders
+                log(f"   [{label}] {label} Level {level}: {price:.2f} qty:0 orders:{orders} (was {old_price:.2f} qty:{old_qty:,})")
+            elif old_price == 0.0:
+                entry['qty'] = 0
+                entry['orders'] = 0
+            else:
+                entry['qty'] = 0
+                entry['orders'] = orders
+                log(f"   [{label}] {label} Level {level}: {old_price:.2f} qty:0 orders:{orders} (preserving structure)")
+        else:
+            entry['price'] = price
+            entry['qty'] = qty
+            entry['orders'] = orders
+            if old_price != price or old_qty != qty:
+                log(f"   [{label}] {label} Level {level}: {price:.2f} qty:{qty:,} orders:{orders} (was {old_price:.2f} qty:{old_qty:,})")
+        
+        if entry['price'] != old_price:
+            moved = True
+        elif entry['qty'] != old_qty or entry['orders'] != old_orders:
+            changed.append(level)
+    return moved, changed
+
+def update_order_book(ticker, bids, asks, tbq, tsq, timestamp, is_snapshot, books=None, events=None,
+                      verbose=None, analytics=None):
+    """Enhanced order book update with guaranteed 50-level depth maintenance.
+
+    `bids`/`asks` are lists of level dicts (decode_market_depth) or the
+    (price, qty, orders, level) arrays of decode_market_depth_columns.
+    `books` defaults to the module-level registry; pass a dict to keep an
+    independent set of books. Spoofing detections are appended to `events`
+    when a list is given. `verbose` and `analytics` (a FlowAnalytics, or
+    False for none) default to the module settings.
+    """
+    if books is None:
+        books = order_books
+    verbose, analytics = _settings(verbose, analytics)
+    log = print if verbose else _silent
+    
+    if ticker not in books:
+        # Initialize empty order book with 50 levels
+        books[ticker] = {
+            'bids': {i: {'price': 0.0, 'qty': 0, 'orders': 0, 'level': i} for i in range(50)},
+            'asks': {i: {'price': 0.0, 'qty': 0, 'orders': 0, 'level': i} for i in range(50)},
+            'tbq': 0,
+            'tsq': 0,
+            'timestamp': 0,
+            'initialized': False
+        }
+    book = books[ticker]
+    
+    # Update total quantities and timestamp
+    book['tbq'] = tbq
+    book['tsq'] = tsq
+    book['timestamp'] = timestamp
+    
+    # Check if this is truly the first update
+    first_update = not book.get('initialized', False)
+    
+    if is_snapshot or first_update:
+        if first_update:
+            log(f"[SNAPSHOT] FIRST UPDATE: Initializing order book for {ticker}")
+            # Only reset on very first update
+            for i in range(50):
+                book['bids'][i] = {'price': 0.0, 'qty': 0, 'orders': 0, 'level': i}
+                book['asks'][i] = {'price': 0.0, 'qty': 0, 'orders': 0, 'level': i}
+        else:
+            log(f"[SNAPSHOT] SNAPSHOT: Updating order book for {ticker}")
+    else:
+        log(f"[INCREMENTAL] INCREMENTAL: Updating {_level_count(bids)} bid levels and "
+            f"{_level_count(asks)} ask levels for {ticker}")
+    
+    bid_changes = _apply_side(ticker, 'bid', book['bids'], bids, timestamp, events, log, analytics)
+    ask_changes = _apply_side(ticker, 'ask', book['asks'], asks, timestamp, events, log, analytics)
+    
+    # Mark as initialized after processing updates
+    book['initialized'] = True
+    # Best level per side only moves when a price does
+    best = book.get('best')
+    if best is None:
+        book['best'] = [_best_slot(book['bids'], True), _best_slot(book['asks'], False)]
+    else:
+        if bid_changes[0]:
+            best[0] = _best_slot(book['bids'], True)
+        if ask_changes[0]:
+            best[1] = _best_slot(book['asks'], False)
+    # Bring the cached read view up to date: sides whose prices moved are
+    # re-sorted, qty/orders-only changes are patched into copies. Views and
+    # payloads handed out earlier are never modified.
+    view = book.get('view')
+    if view is not None and (bid_changes[0] or bid_changes[1] or ask_changes[0] or ask_changes[1]):
+        view = dict(view)
+        _refresh_side(view, 'bid', book['bids'], *bid_changes)
+        _refresh_side(view, 'ask', book['asks'], *ask_changes)
+        book['view'] = view
+    
+    # Post-update validation
+    if verbose:
+        active_bids = len([b for b in book['bids'].values() if b['price'] > 0])
+        active_asks = len([a for a in book['asks'].values() if a['price'] > 0])
+        log(f"   [STATUS] Update complete: {active_bids} active bid levels, {active_asks} active ask levels")
+
+def _best_slot(levels, highest):
+    """Book level holding the best active price (the first one on ties, as in the sorted view)"""
+    best = None
+    best_price = 0.0
+    for i in range(50):
+        price = levels[i]['price']
+        if price > 0 and (best is None or (price > best_price if highest else price < best_price)):
+            best, best_price = i, price
+    return best
+
+def get_top_of_book(ticker, books=None):
+    """(best bid, best ask) level dicts ('price', 'qty', 'orders') without building a view.
+
+    Either side is None when it has no active level; returns None for an
+    unknown ticker.
+    """
+    if books is None:
+        books = order_books
+    book = books.get(ticker)
+    if book is None:
+        return None
+    best = book.get('best')
+    if best is None:
+        # Books restored from a checkpoint have not been through an update yet
+        best = book['best'] = [_best_slot(book['bids'], True), _best_slot(book['asks'], False)]
+    return (book['bids'][best[0]] if best[0] is not None else None,
+            book['asks'][best[1]] if best[1] is not None else None)
+
+def get_full_order_book(ticker, books=None):
+    """Get the complete 50-level order book for display with proper depth reconstruction"""
+    if books is None:
+        books = order_books
+    if ticker not in books:
+        return None
+    
+    book = books[ticker]
+    
+    # Get all bid levels with valid prices, sorted by price (descending for bids)
+    raw_bids = []
+    for i in range(50):
+        bid = book['bids'][i]
+        if bid['price'] > 0:
+            raw_bids.append({
+                'price': bid['price'],
+                'qty': bid['qty'], 
+                'orders': bid['orders'],
+                'level': len(raw_bids)
+            })
+    
+    # Sort bids by price (highest first) and reassign levels
+    raw_bids.sort(key=lambda x: x['price'], reverse=True)
+    active_bids = []
+    for i, bid in enumerate(raw_bids[:50]):
+        active_bids.append({
+            'price': bid['price'],
+            'qty': bid['qty'],
+            'orders': bid['orders'],
+            'level': i
+        })
+    
+    # Get all ask levels with valid prices, sorted by price (ascending for asks)
+    raw_asks = []
+    for i in range(50):
+        ask = book['asks'][i]
+        if ask['price'] > 0:
+            raw_asks.append({
+                'price': ask['price'],
+                'qty': ask['qty'],
+                'orders': ask['orders'],
+                'level': len(raw_asks)
+            })
+    
+    # Sort asks by price (lowest first) and reassign levels
+    raw_asks.sort(key=lambda x: x['price'])
+    active_asks = []
+    for i, ask in enumerate(raw_asks[:50]):
+        active_asks.append({
+            'price': ask['price'],
+            'qty': ask['qty'],
+            'orders': ask['orders'],
+            'level': i
+        })
+    
+    return {
+        'ticker': ticker,
+        'tbq': book['tbq'],
+        'tsq': book['tsq'],
+        'timestamp': book['timestamp'],
+        'bids': active_bids,
+        'asks': active_asks,
+        'bidprice': [bid['price'] for bid in active_bids],
+        'askprice': [ask['price'] for ask in active_asks],
+        'bidqty': [bid['qty'] for bid in active_bids],
+        'askqty': [ask['qty'] for ask in active_asks],
+        'bidordn': [bid['orders'] for bid in active_bids],
+        'askordn': [ask['orders'] for ask in active_asks]
+    }
+
+# View keys per side: rows, prices, qtys, orders, cumulative qtys, best level, row index by book level
+_VIEW_KEYS = {
+    'bid': ('bids', 'bidprice', 'bidqty', 'bidordn', 'bid_cum', 'best_bid', 'bid_index'),
+    'ask': ('asks', 'askprice', 'askqty', 'askordn', 'ask_cum', 'best_ask', 'ask_index'),
+}
+
+def _build_side(levels, reverse):
+    """Sorted active levels of one side as (rows, prices, qtys, orders, cumulative qtys, best, index)"""
+    active = [levels[i] for i in range(50) if levels[i]['price'] > 0]
+    active.sort(key=lambda x: x['price'], reverse=reverse)
+    rows, prices, qtys, orders, cumulative = [], [], [], [], []
+    index = [None] * 50
+    running = 0
+    for i, level in enumerate(active):
+        rows.append({'level': i, 'price': level['price'], 'quantity': level['qty'], 'orders': level['orders']})
+        prices.append(level['price'])
+        qtys.append(level['qty'])
+        orders.append(level['orders'])
+        running += level['qty']
+        cumulative.append(running)
+        index[level['level']] = i
+    return rows, prices, qtys, orders, cumulative, rows[0] if rows else None, index
+
+def _refresh_side(view, side_name, levels, moved, changed):
+    """Replace one side of a (copied) view after _apply_side; the old side's lists are left untouched"""
+    keys = _VIEW_KEYS[side_name]
+    if moved:
+        view.update(zip(keys, _build_side(levels, side_name == 'bid')))
+        return
+    index = view[keys[6]]
+    touched = [index[level] for level in changed if index[level] is not None]
+    if not touched:
+        return  # Only inactive levels (price 0) changed; they are not in the view
+    rows, qtys, orders = list(view[keys[0]]), list(view[keys[2]]), list(view[keys[3]])
+    for level in changed:
+        i = index[level]
+        if i is None:
+            continue
+        entry = levels[level]
+        rows[i] = dict(rows[i], quantity=entry['qty'], orders=entry['orders'])
+        qtys[i] = entry['qty']
+        orders[i] = entry['orders']
+    # Cumulative depth only changes from the first touched row down
+    first = min(touched)
+    cumulative = view[keys[4]][:first]
+    running = cumulative[-1] if cumulative else 0
+    for i in range(first, len(qtys)):
+        running += qtys[i]
+        cumulative.append(running)
+    view.update(zip(keys[:6], (rows, view[keys[1]], qtys, orders, cumulative, rows[0])))
+
+def get_book_view(ticker, books=None):
+    """Ready-to-read view of a book, built on first read and kept current by updates.
+
+    Holds the frontend-shaped `bids`/`asks` rows, the per-field arrays,
+    cumulative depth (`bid_cum`/`ask_cum`) and best bid/ask. Updates swap in
+    a new view instead of changing this one, so a view (and any payload
+    built from it) stays as it was; treat it as read-only.
+    """
+    if books is None:
+        books = order_books
+    book = books.get(ticker)
+    if book is None:
+        return None
+    view = book.get('view')
+    if view is None:
+        view = dict(zip(_VIEW_KEYS['bid'], _build_side(book['bids'], True)))
+        view.update(zip(_VIEW_KEYS['ask'], _build_side(book['asks'], False)))
+        book['view'] = view
+    return view
+
+def view_imbalance(view, depth):
+    """Same result as calculate_order_book_imbalance, read from cumulative depth in O(1)"""
+    bid_cum = view['bid_cum']
+    ask_cum = view['ask_cum']
+    bid_qty = bid_cum[min(depth, len(bid_cum)) - 1] if bid_cum else 0
+    ask_qty = ask_cum[min(depth, len(ask_cum)) - 1] if ask_cum else 0
+    total_qty = bid_qty + ask_qty
+    if total_qty > 0:
+        imbalance = (bid_qty - ask_qty) / total_qty
+        imbalance_pct = imbalance * 100
+    else:
+        imbalance = 0
+        imbalance_pct = 0
+    return {
+        'bid_qty': bid_qty,
+        'ask_qty': ask_qty,
+        'imbalance': imbalance,
+        'imbalance_pct': imbalance_pct,
+        'interpretation': interpret_imbalance(imbalance_pct)
+    }
+
+def _largest_level(prices, qtys, orders):
+    """Largest level in the same shape as analytics.largest_order returns"""
+    if not qtys:
+        return None
+    i = qtys.index(max(qtys))
+    return {'price': prices[i], 'qty': qtys[i], 'orders': orders[i], 'level': i}
+
+def calculate_order_book_imbalance(bids, asks, depth):
+    """Calculate order book imbalance at specified depth level"""
+    try:
+        # Get quantities up to specified depth
+        bid_qty = sum(bid['qty'] for bid in bids[:depth])
+        ask_qty = sum(ask['qty'] for ask in asks[:depth])
+        
+        # Calculate imbalance ratio
+        total_qty = bid_qty + ask_qty
+        if total_qty > 0:
+            imbalance = (bid_qty - ask_qty) / total_qty
+            imbalance_pct = imbalance * 100
+        else:
+            imbalance = 0
+            imbalance_pct = 0
+        
+        return {
+            'bid_qty': bid_qty,
+            'ask_qty': ask_qty,
+            'imbalance': imbalance,
+            'imbalance_pct': imbalance_pct,
+            'interpretation': interpret_imbalance(imbalance_pct)
+        }
+    except Exception as e:
+        print(f"Error calculating imbalance: {e}")
+        return {
+            'bid_qty': 0,
+            'ask_qty': 0,
+            'imbalance': 0,
+            'imbalance_pct': 0,
+            'interpretation': 'Unknown'
+        }
+
+def interpret_imbalance(imbalance_pct):
+    """Interpret the imbalance percentage"""
+    if imbalance_pct > 30:
+        return "Strong Buying Pressure"
+    elif imbalance_pct > 15:
+        return "Moderate Buying Pressure"
+    elif imbalance_pct > 5:
+        return "Slight Buying Pressure"
+    elif imbalance_pct < -30:
+        return "Strong Selling Pressure"
+    elif imbalance_pct < -15:
+        return "Moderate Selling Pressure"
+    elif imbalance_pct < -5:
+        return "Slight Selling Pressure"
+    else:
+        return "Balanced"
+
+def process_market_depth(message_bytes, events=None, on_update=None, received=None):
+    """Process market depth protobuf message with proper order book management"""
+    try:
+        updates = decode_market_depth(message_bytes, received)
+        if updates is None:
+            return None
+        return apply_market_depth(updates, events=events, on_update=on_update)
+    except Exception as e:
+        print(f"Error processing market depth: {e}")
+        return None
+
+def apply_market_depth(updates, books=None, events=None, on_update=None, verbose=None, analytics=None):
+    """Apply decoded per-ticker updates to the order books and build frontend payloads.
+
+    `on_update(ticker, book)` is called after each ticker's book changes;
+    returning False skips building that ticker's payload. `verbose` and
+    `analytics` are passed to update_order_book.
+    """
+    try:
+        market_data = {}
+        for update in updates:
+            ticker = update['ticker']
+            
+            # Update the order book
+            update_order_book(ticker, update['bids'], update['asks'], update['tbq'], update['tsq'],
+                              update['timestamp'], update['is_snapshot'], books, events, verbose, analytics)
+            # Latency inputs ride along with the book for the payload
+            book = (order_books if books is None else books)[ticker]
+            book['send_time'] = update.get('send_time')
+            book['received'] = update.get('received')
+            # Quote fields are sparse: keep the last value seen
+            if update.get('oi') is not None:
+                book['oi'] = update['oi']
+            if update.get('ltp') is not None:
+                book['ltp'] = update['ltp']
+            if on_update is not None and not on_update(ticker, book):
+                continue
+            
+            frontend_data = build_depth_payload(ticker, books, analytics)
+            if frontend_data:
+                market_data[ticker] = frontend_data
+        
+        return market_data if len(market_data) > 0 else None
+    except Exception as e:
+        print(f"Error processing market depth: {e}")
+        return None
+
+def build_depth_payload(ticker, books=None, analytics=None):
+    """Build the frontend market_depth payload for one ticker from its current book view"""
+    if books is None:
+        books = order_books
+    if analytics is None:
+        analytics = default_analytics
+    view = get_book_view(ticker, books)
+    if view is None:
+        return None
+    book = books[ticker]
+    opp, spread_bps = spread_opportunity(view['best_bid'], view['best_ask'])
+    # Lists come straight from the view: no per-message reshaping
+    return {
+        'ticker': ticker,
+        'timestamp': book['timestamp'] * 1000,
+        'send_time': book.get('send_time'),
+        'received': book.get('received'),
+        'oi': book.get('oi'),
+        'ltp': book.get('ltp'),
+        'total_bid_qty': book['tbq'],
+        'total_sell_qty': book['tsq'],
+        'bids': view['bids'],
+        'asks': view['asks'],
+        'bidprice': view['bidprice'],
+        'askprice': view['askprice'],
+        'bidqty': view['bidqty'],
+        'askqty': view['askqty'],
+        'bidordn': view['bidordn'],
+        'askordn': view['askordn'],
+        # Imbalances at different depths from cumulative depth
+        'imbalance_10': view_imbalance(view, 10),
+        'imbalance_20': view_imbalance(view, 20),
+        'imbalance_50': view_imbalance(view, 50),
+        'largest_bid': _largest_level(view['bidprice'], view['bidqty'], view['bidordn']),
+        'largest_ask': _largest_level(view['askprice'], view['askqty'], view['askordn']),
+        'spread_bps': spread_bps,
+        'opportunity': opp,
+        'order_flow': dict(analytics.order_flow_stats) if analytics else {},
+        'stale': False,
+    }
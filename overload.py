@@ -0,0 +1,126 @@
+# Overload controller: degrade optional work before the feed falls behind.
+#
+# Inputs are the frame backlog (WebSocket receive queue plus decode pool or
+# shard queue) and the apply lag (local receive stamp to book update, so the
+# broker clock and its offset estimate play no part). Levels escalate one step at a time while either input is
+# over its limit and recover one step at a time after both have stayed under
+# half their limits for OVERLOAD_RECOVER_SECONDS:
+#
+#   0 normal          everything on
+#   1 shed_analytics  no per-level logging, flow/spoof analytics or heatmap
+#   2 conflate        market_depth payloads built and emitted at most every
+#                     OVERLOAD_EMIT_INTERVAL_MS per symbol; the feed thread
+#                     flushes pending symbols on a timer when frames stop
+#   3 visible_only    only the displayed symbol gets payloads
+#
+# Book updates are never shed at any level.
+import os
+import time
+
+OVERLOAD_LAG_MS = float(os.getenv('OVERLOAD_LAG_MS', '500'))
+OVERLOAD_QUEUE_DEPTH = int(os.getenv('OVERLOAD_QUEUE_DEPTH', '200'))
+OVERLOAD_EMIT_INTERVAL_MS = float(os.getenv('OVERLOAD_EMIT_INTERVAL_MS', '250'))
+OVERLOAD_RECOVER_SECONDS = float(os.getenv('OVERLOAD_RECOVER_SECONDS', '5'))
+
+NORMAL, SHED_ANALYTICS, CONFLATE, VISIBLE_ONLY = range(4)
+LEVEL_NAMES = ('normal', 'shed_analytics', 'conflate', 'visible_only')
+
+class OverloadController:
+    """Hysteresis state machine over lag and backlog; listeners are told about level changes"""
+
+    def __init__(self, lag_ms=OVERLOAD_LAG_MS, queue_depth=OVERLOAD_QUEUE_DEPTH,
+                 emit_interval_ms=OVERLOAD_EMIT_INTERVAL_MS, recover_seconds=OVERLOAD_RECOVER_SECONDS,
+                 escalate_seconds=1.0, check_seconds=0.25):
+        self.lag_limit = lag_ms
+        self.queue_limit = queue_depth
+        self.emit_interval = emit_interval_ms / 1000.0
+        self.recover_seconds = recover_seconds
+        self.escalate_seconds = escalate_seconds
+        self.check_seconds = check_seconds
+        self.level = NORMAL
+        self.level_since = time.time()
+        self.calm_since = None
+        self.next_check = 0.0
+        self.lag_ms = 0.0
+        self.queue_depth = 0
+        self.transitions = 0
+        self.listeners = []
+        # Conflation state: tickers with unpublished changes and when each may next emit
+        self.pending = set()
+        self.next_emit = {}
+        self.conflated_updates = 0
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def sample_lag(self, lag_ms):
+        """Apply lag of one update; smoothed so a single late frame does not trip a level"""
+        self.lag_ms += (lag_ms - self.lag_ms) * 0.1
+
+    def sample_queue(self, depth, now=None):
+        """Backlog right now; re-evaluates the level at most every check_seconds"""
+        self.queue_depth = depth
+        now = now or time.time()
+        if now >= self.next_check:
+            self.next_check = now + self.check_seconds
+            self._evaluate(now)
+
+    def _evaluate(self, now):
+        overloaded = self.lag_ms > self.lag_limit or self.queue_depth > self.queue_limit
+        calm = self.lag_ms < self.lag_limit / 2 and self.queue_depth < self.queue_limit / 2
+        if overloaded:
+            self.calm_since = None
+            if self.level < VISIBLE_ONLY and now - self.level_since >= self.escalate_seconds:
+                self._set_level(self.level + 1, now)
+        elif calm and self.level > NORMAL:
+            if self.calm_since is None:
+                self.calm_since = now
+            elif now - self.calm_since >= self.recover_seconds:
+                self.calm_since = now
+                self._set_level(self.level - 1, now)
+        else:
+            self.calm_since = None
+
+    def _set_level(self, level, now):
+        previous = self.level
+        self.level = level
+        self.level_since = now
+        self.transitions += 1
+        print(f"[OVERLOAD] {LEVEL_NAMES[previous]} -> {LEVEL_NAMES[level]} "
+              f"(lag {self.lag_ms:.0f} ms, backlog {self.queue_depth})")
+        for listener in self.listeners:
+            listener(self.status())
+
+    def wants_payload(self, ticker, visible):
+        """Whether to build a payload for this update now; otherwise it is conflated"""
+        if self.level < CONFLATE:
+            return True
+        if self.level >= VISIBLE_ONLY and not visible:
+            return False
+        self.pending.add(ticker)
+        self.conflated_updates += 1
+        return False
+
+    def due_tickers(self, now=None):
+        """Pending tickers whose emit interval has passed (removed from pending)"""
+        if not self.pending:
+            return []
+        now = now or time.time()
+        due = [ticker for ticker in self.pending if now >= self.next_emit.get(ticker, 0.0)]
+        for ticker in due:
+            self.pending.discard(ticker)
+            self.next_emit[ticker] = now + self.emit_interval
+        return due
+
+    def status(self):
+        return {
+            'level': self.level,
+            'state': LEVEL_NAMES[self.level],
+            'since': int(self.level_since * 1000),
+            'lag_ms': round(self.lag_ms, 1),
+            'queue_depth': self.queue_depth,
+            'lag_limit_ms': self.lag_limit,
+            'queue_limit': self.queue_limit,
+            'transitions': self.transitions,
+            'conflated_updates': self.conflated_updates,
+        }
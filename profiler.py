@@ -0,0 +1,207 @@
+# Opt-in, on-demand profiling of the feed thread on a live process.
+#
+# CPU: a background thread samples the target thread's stack through
+# sys._current_frames() every few milliseconds and aggregates collapsed stacks
+# ("root;caller;callee count" lines) that flamegraph.pl, speedscope or
+# inferno read directly. Nothing is installed into the profiled thread, so
+# starting and stopping a capture never touches the feed loop.
+#
+# Memory: with allocations enabled, tracemalloc runs for the capture only.
+# The feed path wraps its stages in Profiler.stage() while a capture is
+# tracing, recording net and peak allocated bytes per stage. Before/after
+# snapshots give the top allocation sites.
+import os
+import sys
+import json
+import time
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILING = os.getenv('PROFILING', '').strip("'").lower() in ('1', 'true', 'yes')
+PROFILE_SECONDS = float(os.getenv('PROFILE_SECONDS', '10'))
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles').strip("'")
+PROFILE_MAX_SECONDS = 300
+FEED_THREAD_NAME = 'feed'
+MAX_STACK_DEPTH = 128
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def collapse_stack(frame):
+    """Outermost-first list of frame labels for a thread's current frame"""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+class Profiler:
+    """One capture at a time: stack sampling plus optional per-stage tracemalloc accounting"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = False
+        self.tracing = False  # True while stage() should account allocations
+        self.stop_event = threading.Event()
+        self.stages = {}
+        self.result = None
+        self.collapsed = ''
+
+    def start(self, seconds=PROFILE_SECONDS, interval_ms=PROFILE_INTERVAL_MS,
+              thread_name=FEED_THREAD_NAME, allocations=False, on_done=None):
+        """Start a capture in the background; returns False if one is already running"""
+        seconds = min(max(float(seconds), 0.1), PROFILE_MAX_SECONDS)
+        interval = max(float(interval_ms), 1.0) / 1000.0
+        with self.lock:
+            if self.running:
+                return False
+            self.running = True
+            self.stop_event.clear()
+        threading.Thread(
+            target=self._capture,
+            args=(seconds, interval, thread_name, allocations, on_done),
+            name='profiler',
+            daemon=True
+        ).start()
+        print(f"[PROFILE] Capturing {thread_name or 'all threads'} for {seconds:.1f}s "
+              f"every {interval * 1000:.0f} ms (allocations: {allocations})")
+        return True
+
+    def stop(self):
+        """End the running capture early; the result is still produced"""
+        self.stop_event.set()
+
+    @contextmanager
+    def stage(self, name):
+        """Account allocations and time of a feed stage; only use while self.tracing"""
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            current, peak = tracemalloc.get_traced_memory()
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = {'calls': 0, 'seconds': 0.0, 'net_bytes': 0, 'peak_bytes': 0}
+            stats['calls'] += 1
+            stats['seconds'] += elapsed
+            stats['net_bytes'] += current - before
+            stats['peak_bytes'] = max(stats['peak_bytes'], peak - before)
+
+    def _capture(self, seconds, interval, thread_name, allocations, on_done):
+        stacks = Counter()
+        samples = 0
+        started_tracemalloc = False
+        baseline = None
+        started = time.time()
+        try:
+            if allocations:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    started_tracemalloc = True
+                baseline = tracemalloc.take_snapshot()
+                self.stages = {}
+                self.tracing = True
+
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline and not self.stop_event.is_set():
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                me = threading.get_ident()
+                for ident, frame in sys._current_frames().items():
+                    name = names.get(ident, str(ident))
+                    if ident == me or (thread_name and name != thread_name):
+                        continue
+                    stacks[';'.join([name] + collapse_stack(frame))] += 1
+                samples += 1
+                self.stop_event.wait(interval)
+
+            result = {
+                'started': started,
+                'seconds': round(time.time() - started, 3),
+                'interval_ms': interval * 1000,
+                'thread': thread_name or 'all',
+                'samples': samples,
+                'top_functions': self._top_functions(stacks),
+            }
+            if allocations:
+                self.tracing = False
+                snapshot = tracemalloc.take_snapshot()
+                result['allocations'] = {
+                    'stages': {
+                        name: dict(stats, mean_us=round(stats['seconds'] / stats['calls'] * 1e6, 1))
+                        for name, stats in self.stages.items()
+                    },
+                    'top_sites': [
+                        {
+                            'site': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                            'size_diff': stat.size_diff,
+                            'count_diff': stat.count_diff,
+                        }
+                        for stat in snapshot.compare_to(baseline, 'lineno')[:25]
+                    ],
+                }
+            self.collapsed = '\n'.join(f"{stack} {count}" for stack, count in stacks.most_common())
+            self.result = result
+            print(f"[PROFILE] Capture finished: {samples} samples, {len(stacks)} distinct stacks")
+            if on_done:
+                on_done(result, self.collapsed)
+        except Exception as e:
+            print(f"[PROFILE] Capture failed: {e}")
+        finally:
+            self.tracing = False
+            if started_tracemalloc:
+                tracemalloc.stop()
+            with self.lock:
+                self.running = False
+
+    @staticmethod
+    def _top_functions(stacks, limit=25):
+        """Self (leaf) and total sample counts per function"""
+        leaf = Counter()
+        total = Counter()
+        for stack, count in stacks.items():
+            frames = stack.split(';')[1:]
+            if frames:
+                leaf[frames[-1]] += count
+            for label in set(frames):
+                total[label] += count
+        return [
+            {'function': label, 'self': count, 'total': total[label]}
+            for label, count in leaf.most_common(limit)
+        ]
+
+    def status(self):
+        return {'running': self.running, 'tracing': self.tracing, 'result': self.result}
+
+def write_capture(result, collapsed, directory=PROFILE_DIR):
+    """Save a finished capture as <stamp>.collapsed (flamegraph input) and <stamp>.json"""
+    os.makedirs(directory, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(result['started']))
+    base = os.path.join(directory, f'profile-{stamp}')
+    with open(base + '.collapsed', 'w') as f:
+        f.write(collapsed + '\n')
+    with open(base + '.json', 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"[PROFILE] Wrote {base}.collapsed and {base}.json")
+
+def install_signal_handler(profiler):
+    """SIGUSR1 starts a PROFILE_SECONDS capture written to PROFILE_DIR, or stops a running one"""
+    import signal
+    if not hasattr(signal, 'SIGUSR1'):
+        return
+
+    def handle(signum, frame):
+        if profiler.running:
+            profiler.stop()
+        else:
+            profiler.start(allocations=True, on_done=write_capture)
+
+    signal.signal(signal.SIGUSR1, handle)
+    print(f"[PROFILE] Send SIGUSR1 to pid {os.getpid()} to start/stop a capture")
@@ -0,0 +1,160 @@
+# Synthetic instruments over several subscribed symbols: calendar spreads,
+# futures basis, ratio spreads.
+#
+# Defined in SYNTHETICS, separated by ';', with whitespace around + and -
+# (symbols may contain '-'):
+#   "CAL = NSE:NIFTY25AUGFUT - NSE:NIFTY25JULFUT; BASIS = NSE:NIFTY25JULFUT - NSE:NIFTY50-INDEX"
+# A leg may carry a ratio: "FLY = NSE:A - 2*NSE:B + NSE:C".
+#
+# A dependency index maps each leg symbol to the synthetics using it. A book
+# update only marks those synthetics dirty, and only when the leg's
+# top-of-book actually changed. Dirty synthetics are recomputed once per
+# publish.
+import os
+import time
+
+from order_book import get_top_of_book
+
+SYNTHETICS = os.getenv('SYNTHETICS', '').strip("'")
+
+def parse_synthetic(text):
+    """'NAME = [ratio*]SYMBOL (+|-) [ratio*]SYMBOL ...' -> {'name', 'legs': [(symbol, weight)]}"""
+    name, sep, expression = text.partition('=')
+    name = name.strip()
+    if not sep or not name:
+        raise ValueError(f"Synthetic needs the form 'NAME = LEG - LEG': {text!r}")
+    legs = []
+    sign = 1.0
+    for token in expression.split():
+        if token in ('+', '-'):
+            sign = -1.0 if token == '-' else 1.0
+            continue
+        ratio, _, symbol = token.rpartition('*')
+        if ':' not in symbol:
+            raise ValueError(f"Synthetic {name}: {symbol!r} is not an EXCHANGE:SYMBOL ticker")
+        legs.append((symbol, sign * float(ratio or 1)))
+        sign = 1.0
+    if not legs:
+        raise ValueError(f"Synthetic {name} has no legs")
+    return {'name': name, 'legs': legs}
+
+def load_synthetics(text=SYNTHETICS):
+    definitions = []
+    for part in text.split(';'):
+        if part.strip():
+            try:
+                definitions.append(parse_synthetic(part))
+            except ValueError as e:
+                print(f"[SYNTH] {e}")
+    return definitions
+
+def top_of_book(ticker, book, books=None):
+    """(bid, bid_qty, ask, ask_qty) of a leg; index-style legs without depth use LTP with unknown size"""
+    best_bid, best_ask = get_top_of_book(ticker, books)
+    if best_bid and best_ask:
+        return (best_bid['price'], best_bid['qty'], best_ask['price'], best_ask['qty'])
+    if book.get('ltp'):
+        return (book['ltp'], None, book['ltp'], None)
+    return None
+
+class SyntheticEngine:
+    """Synthetic quotes kept current through a symbol -> synthetic dependency index"""
+
+    def __init__(self, definitions):
+        self.definitions = definitions
+        self.dependents = {}
+        for index, definition in enumerate(definitions):
+            for symbol, _ in definition['legs']:
+                self.dependents.setdefault(symbol, set()).add(index)
+        self.tops = {}
+        self.values = [self._empty(definition) for definition in definitions]
+        self.dirty = set()
+        self.recomputes = 0
+
+    @property
+    def symbols(self):
+        return list(self.dependents)
+
+    def on_book(self, ticker, book, books=None):
+        """Note a book update; dependents are marked dirty only if the leg's top-of-book moved"""
+        dependents = self.dependents.get(ticker)
+        if not dependents:
+            return
+        top = top_of_book(ticker, book, books)
+        if self.tops.get(ticker) == top:
+            return
+        self.tops[ticker] = top
+        self.dirty.update(dependents)
+
+    def pop_changed(self):
+        """Recompute dirty synthetics and return their new quotes"""
+        if not self.dirty:
+            return []
+        changed = []
+        for index in self.dirty:
+            self.values[index] = self._compute(self.definitions[index])
+            changed.append(self.values[index])
+        self.recomputes += len(self.dirty)
+        self.dirty.clear()
+        return changed
+
+    def snapshot(self):
+        return list(self.values)
+
+    @staticmethod
+    def _empty(definition):
+        return {
+            'name': definition['name'],
+            'legs': [{'symbol': symbol, 'weight': weight} for symbol, weight in definition['legs']],
+            'complete': False,
+            'bid': None, 'ask': None, 'mid': None,
+            'bid_qty': None, 'ask_qty': None,
+            'time': None,
+        }
+
+    def _compute(self, definition):
+        """Price the synthetic against the legs' current top-of-book.
+
+        Selling the synthetic hits the bid of long legs and lifts the ask of
+        short legs (and vice versa for buying). Size is the tightest leg's
+        top-level size divided by its ratio.
+        """
+        result = self._empty(definition)
+        bid = ask = 0.0
+        bid_sizes, ask_sizes = [], []
+        for symbol, weight in definition['legs']:
+            top = self.tops.get(symbol)
+            if top is None:
+                return result
+            leg_bid, leg_bid_qty, leg_ask, leg_ask_qty = top
+            if weight > 0:
+                bid += weight * leg_bid
+                ask += weight * leg_ask
+                bid_sizes.append((leg_bid_qty, weight))
+                ask_sizes.append((leg_ask_qty, weight))
+            else:
+                bid += weight * leg_ask
+                ask += weight * leg_bid
+                bid_sizes.append((leg_ask_qty, -weight))
+                ask_sizes.append((leg_bid_qty, -weight))
+        bid_qty = [qty / weight for qty, weight in bid_sizes if qty is not None]
+        ask_qty = [qty / weight for qty, weight in ask_sizes if qty is not None]
+        result.update({
+            'complete': True,
+            'bid': round(bid, 4),
+            'ask': round(ask, 4),
+            'mid': round((bid + ask) / 2, 4),
+            'bid_qty': min(bid_qty) if bid_qty else None,
+            'ask_qty': min(ask_qty) if ask_qty else None,
+            'time': time.time(),
+        })
+        return result
+
+def create_synthetic_engine():
+    """SyntheticEngine from SYNTHETICS, or None when none are defined"""
+    definitions = load_synthetics()
+    if not definitions:
+        return None
+    engine = SyntheticEngine(definitions)
+    print(f"[SYNTH] Tracking {len(definitions)} synthetics over {len(engine.dependents)} symbols")
+    return engine
@@ -0,0 +1,142 @@
+# Token state shared between app instances.
+#
+# Three things have to agree across every instance behind the load balancer:
+#   - auth changes (login, re-login, logout) invalidate each instance's
+#     decrypted-auth cache immediately instead of after AUTH_CACHE_TTL
+#   - each user's feed runs on exactly one instance (a renewable lease)
+#   - small per-user settings such as the selected symbols
+#
+# TOKEN_STORE_URL picks the backend: empty or 'memory://' keeps everything in
+# this process (a single instance, or local development), 'redis://host:6379/0'
+# shares it through Redis (needs the optional `redis` package).
+import os
+import json
+import time
+import socket
+import threading
+import uuid
+
+TOKEN_STORE_URL = os.getenv('TOKEN_STORE_URL', '').strip("'")
+TOKEN_STORE_CHANNEL = 'fyers-dom:auth'
+
+# Identifies this process as a lease owner
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+class MemoryTokenStore:
+    """In-process backend: messages go straight to local subscribers, leases live in a dict"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+        self.leases = {}  # key -> (owner, expires_at)
+        self.subscribers = []
+
+    def publish(self, message):
+        for callback in list(self.subscribers):
+            _deliver(callback, message)
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def get(self, key):
+        with self.lock:
+            return self.values.get(key)
+
+    def set(self, key, value):
+        with self.lock:
+            self.values[key] = value
+
+    def acquire(self, key, owner, ttl):
+        """Take or renew a lease; False if another owner holds an unexpired one"""
+        now = time.monotonic()
+        with self.lock:
+            current = self.leases.get(key)
+            if current and current[0] != owner and current[1] > now:
+                return False
+            self.leases[key] = (owner, now + ttl)
+            return True
+
+    def release(self, key, owner):
+        with self.lock:
+            current = self.leases.get(key)
+            if current and current[0] == owner:
+                del self.leases[key]
+
+class RedisTokenStore:
+    """Redis backend: pub/sub for messages, SET NX PX leases, plain keys for values"""
+
+    RENEW = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) end return 0"
+    RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+    def __init__(self, url):
+        import redis
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.subscribers = []
+        self.pubsub = None
+        self.renew = self.redis.register_script(self.RENEW)
+        self.release_script = self.redis.register_script(self.RELEASE)
+
+    def publish(self, message):
+        self.redis.publish(TOKEN_STORE_CHANNEL, json.dumps(message))
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+        if self.pubsub is None:
+            self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            self.pubsub.subscribe(**{TOKEN_STORE_CHANNEL: self._on_message})
+            self.pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def _on_message(self, item):
+        try:
+            message = json.loads(item['data'])
+        except (TypeError, ValueError):
+            return
+        for callback in list(self.subscribers):
+            _deliver(callback, message)
+
+    def get(self, key):
+        value = self.redis.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value):
+        self.redis.set(key, json.dumps(value))
+
+    def acquire(self, key, owner, ttl):
+        ttl_ms = int(ttl * 1000)
+        if self.redis.set(key, owner, nx=True, px=ttl_ms):
+            return True
+        return bool(self.renew(keys=[key], args=[owner, ttl_ms]))
+
+    def release(self, key, owner):
+        self.release_script(keys=[key], args=[owner])
+
+def _deliver(callback, message):
+    try:
+        callback(message)
+    except Exception as e:
+        print(f"[TOKENS] Error in token store subscriber: {e}")
+
+def create_token_store(url=TOKEN_STORE_URL):
+    if url.startswith(('redis://', 'rediss://')):
+        try:
+            store = RedisTokenStore(url)
+            print(f"[TOKENS] Sharing token state through {url.split('@')[-1]}")
+            return store
+        except ImportError:
+            print("[TOKENS] TOKEN_STORE_URL is a Redis URL but the redis package is not installed; "
+                  "token state stays local to this instance")
+    elif url and not url.startswith('memory://'):
+        print(f"[TOKENS] Unsupported TOKEN_STORE_URL {url!r}; token state stays local to this instance")
+    return MemoryTokenStore()
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_token_store():
+    """Process-wide store, created on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_token_store()
+    return _store